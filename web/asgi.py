@@ -0,0 +1,679 @@
+#!/usr/bin/python3
+"""ASGI variant of app.py, on an AsyncConnectionPool.
+
+Serves the same pages and JSON responses with the same templates, but every
+request is a coroutine, so one process keeps many DB-bound requests in flight
+while they wait on Postgres. Run it with an ASGI server, e.g.
+
+    hypercorn asgi:app --bind 0.0.0.0:5001
+
+The streaming, export, import and metrics endpoints are only served by the
+WSGI app, as are conditional GETs: no view here sends an ETag or answers
+304 Not Modified (see versions.py).
+"""
+import datetime
+import re
+from logging.config import dictConfig
+
+import psycopg
+from psycopg.rows import namedtuple_row
+from psycopg_pool import AsyncConnectionPool
+from quart import flash
+from quart import jsonify
+from quart import make_response
+from quart import Quart
+from quart import redirect
+from quart import render_template
+from quart import request
+from quart import url_for
+
+import cascade
+import events
+import ingest
+import invalidation
+import notifications
+import pagination
+import search
+import statements
+from cache import TTLCache
+from ids import AsyncIdAllocator
+from settings import DATABASE_URL
+from settings import POOL_MAX_SIZE
+from settings import POOL_MIN_SIZE
+from settings import POOL_TIMEOUT
+
+pool = AsyncConnectionPool(
+    conninfo=DATABASE_URL,
+    open=False,
+    min_size=POOL_MIN_SIZE,
+    max_size=POOL_MAX_SIZE,
+    timeout=POOL_TIMEOUT,
+)
+# opened once the event loop is running, see open_pool().
+
+dictConfig(
+    {
+        "version": 1,
+        "formatters": {
+            "default": {
+                "format": "[%(asctime)s] %(levelname)s in %(module)s:%(lineno)s - %(funcName)20s(): %(message)s",
+            }
+        },
+        "handlers": {
+            "asgi": {
+                "class": "logging.StreamHandler",
+                "formatter": "default",
+            }
+        },
+        "root": {"level": "INFO", "handlers": ["asgi"]},
+    }
+)
+
+app = Quart(__name__)
+log = app.logger
+
+order_ids = AsyncIdAllocator(pool, "order_no_seq")
+cust_ids = AsyncIdAllocator(pool, "cust_no_seq")
+
+# product catalog, invalidated by every write to product, in any worker (see invalidation.py)
+catalog = TTLCache(maxsize=1024, ttl=3600)
+invalidation.listen([catalog])
+
+
+@app.before_serving
+async def open_pool():
+    await pool.open()
+    notifications.start(DATABASE_URL)
+
+
+@app.after_serving
+async def close_pool():
+    await pool.close()
+
+
+def wants_json():
+    return (
+        request.accept_mimetypes["application/json"]
+        and not request.accept_mimetypes["text/html"]
+    )
+
+
+async def load_products():
+    """Read the whole catalog, alphabetically."""
+
+    async with pool.connection() as conn:
+        async with conn.cursor(row_factory=namedtuple_row) as cur:
+            await statements.execute_async(cur, "product_list", {})
+            products = await cur.fetchall()
+            log.debug(f"Found {cur.rowcount} rows.")
+    return products
+
+
+async def load_product_page(after, size):
+    """Read the page of the catalog that follows the (name, SKU) key ``after``."""
+
+    async with pool.connection() as conn:
+        async with conn.cursor(row_factory=namedtuple_row) as cur:
+            await statements.execute_async(
+                cur,
+                "product_page",
+                {"name": after[0], "SKU": after[1], "limit": size + 1},
+            )
+            products = await cur.fetchall()
+            log.debug(f"Found {cur.rowcount} rows.")
+    return pagination.split_page(products, size, lambda row: [row.name, row.sku])
+
+
+async def load_product(SKU):
+    """Read a single product."""
+
+    async with pool.connection() as conn:
+        async with conn.cursor(row_factory=namedtuple_row) as cur:
+            await statements.execute_async(cur, "product_by_sku", {"SKU": SKU})
+            product = await cur.fetchone()
+            log.debug(f"Found {cur.rowcount} rows.")
+    return product
+
+
+@app.route("/", methods=("GET",))
+@app.route("/main", methods=("GET",))
+async def main_page():
+    """Show all the menus."""
+
+    return await render_template("main.html")
+
+
+@app.route("/main/products", methods=("GET",))
+async def product_index():
+    """Show the products alphabetically, one page at a time."""
+
+    size = pagination.page_size(request.args)
+    after = pagination.decode_cursor(request.args.get("after"), ("", ""))
+    products, next_page = await catalog.get_async(
+        ("product", "page", after, size), lambda: load_product_page(after, size)
+    )
+
+    if wants_json():
+        return jsonify(products=products, next=next_page)
+
+    return await render_template("product/index.html", products=products, next_page=next_page)
+
+
+@app.route("/main/products/<SKU>/update", methods=("GET", "POST"))
+async def product_update(SKU):
+    """Update the product balance and description."""
+
+    product = await catalog.get_async(("product", "sku", SKU), lambda: load_product(SKU))
+
+    if request.method == "POST":
+        form = await request.form
+        price = form["price"]
+        description = form["description"]
+        error = None
+
+        if not price:
+            error = "Price is required."
+            if not price.isnumeric():
+                error = "Price is required to be numeric."
+        if error is not None:
+            await flash(error)
+        else:
+            async with pool.connection() as conn:
+                async with conn.cursor(row_factory=namedtuple_row) as cur:
+                    await statements.execute_async(
+                        cur,
+                        "product_update",
+                        {"SKU": SKU, "price": price, "description": description},
+                    )
+                await conn.commit()
+            catalog.invalidate("product")
+            return redirect(url_for("product_index"))
+
+    return await render_template("product/update.html", product=product)
+
+
+@app.route("/main/products/<SKU>/delete", methods=("POST",))
+async def product_delete(SKU):
+    """Delete the product, and in case the product is the last contained in
+    an order, the same order is deleted."""
+
+    async with pool.connection() as conn:
+        async with conn.cursor(row_factory=namedtuple_row) as cur:
+            await cascade.delete_products_async(cur, [SKU])
+        await conn.commit()
+    catalog.invalidate("product")
+    return redirect(url_for("product_index"))
+
+
+@app.route("/main/products/delete", methods=("POST",))
+async def product_bulk_delete():
+    """Delete many products at once, given as a JSON list of SKUs."""
+
+    skus = cascade.keys(await request.get_json(silent=True), "skus", str)
+    if skus is None:
+        return jsonify({"message": 'Expected {"skus": [SKU, ...]}.', "status": "error"}), 400
+
+    async with pool.connection() as conn:
+        async with conn.cursor(row_factory=namedtuple_row) as cur:
+            deleted = await cascade.delete_products_async(cur, skus)
+            log.debug(f"Deleted {deleted} products.")
+        await conn.commit()
+    catalog.invalidate("product")
+    return jsonify({"deleted": deleted})
+
+
+@app.route("/main/products/create", methods=("GET", "POST",))
+async def product_create():
+    """Create a new product."""
+
+    if request.method == "POST":
+        form = await request.form
+        sku = form["sku"]
+        name = form["name"]
+        description = form["description"]
+        price = form["price"]
+        ean = form["ean"]
+
+        error = None
+
+        if ean == "":
+            ean = None
+
+        if not name:
+            error = "Name is required."
+
+        if not price:
+            error = "Price is required."
+
+        if error is not None:
+            await flash(error)
+        else:
+            async with pool.connection() as conn:
+                async with conn.cursor(row_factory=namedtuple_row) as cur:
+                    await statements.execute_async(
+                        cur,
+                        "product_create",
+                        {"sku": sku, "name": name, "description": description, "price": price, "ean": ean},
+                    )
+                await conn.commit()
+            catalog.invalidate("product")
+            return redirect(url_for("product_index"))
+    return await render_template("product/create.html")
+
+# ----------------------------------------------------------------------------------- #
+
+
+@app.route("/main/suppliers", methods=("GET",))
+async def supplier_index():
+    """Show the suppliers, ordered by ascending TIN, one page at a time."""
+
+    size = pagination.page_size(request.args)
+    (after,) = pagination.decode_cursor(request.args.get("after"), ("",))
+
+    async with pool.connection() as conn:
+        async with conn.cursor(row_factory=namedtuple_row) as cur:
+            await statements.execute_async(cur, "supplier_page", {"after": after, "limit": size + 1})
+            suppliers = await cur.fetchall()
+            log.debug(f"Found {cur.rowcount} rows.")
+    suppliers, next_page = pagination.split_page(suppliers, size, lambda row: [row.tin])
+
+    if wants_json():
+        return jsonify(suppliers=suppliers, next=next_page)
+
+    return await render_template("supplier/index.html", suppliers=suppliers, next_page=next_page)
+
+
+@app.route("/main/suppliers/<TIN>/delete", methods=("POST",))
+async def supplier_delete(TIN):
+    """Delete the supplier."""
+
+    async with pool.connection() as conn:
+        async with conn.cursor(row_factory=namedtuple_row) as cur:
+            await cascade.delete_supplier_async(cur, TIN)
+        await conn.commit()
+    return redirect(url_for("supplier_index"))
+
+
+@app.route("/main/suppliers/create", methods=("GET", "POST",))
+async def supplier_create():
+    """Create a new supplier."""
+
+    if request.method == "POST":
+        form = await request.form
+        tin = form["tin"]
+        name = form["name"]
+        address = form["address"]
+        sku = form["sku"]
+        date = form["date"]
+
+        error = None
+
+        if not name:
+            error = "Name is required."
+
+        if error is not None:
+            await flash(error)
+        else:
+            async with pool.connection() as conn:
+                async with conn.cursor(row_factory=namedtuple_row) as cur:
+                    await statements.execute_async(
+                        cur,
+                        "supplier_create",
+                        {"tin": tin, "name": name, "address": address, "sku": sku, "date": date},
+                    )
+                await conn.commit()
+            return redirect(url_for("supplier_index"))
+
+    return await render_template("supplier/create.html")
+
+#--------------------------------------------------------------------------------------------#
+
+@app.route("/main/customers", methods=("GET",))
+async def customer_index():
+    """Show the customers, ordered by customer number, one page at a time."""
+
+    size = pagination.page_size(request.args)
+    (after,) = pagination.decode_cursor(request.args.get("after"), (0,))
+
+    async with pool.connection() as conn:
+        async with conn.cursor(row_factory=namedtuple_row) as cur:
+            await statements.execute_async(cur, "customer_page", {"after": after, "limit": size + 1})
+            customers = await cur.fetchall()
+            log.debug(f"Found {cur.rowcount} rows.")
+    customers, next_page = pagination.split_page(customers, size, lambda row: [row.cust_no])
+
+    if wants_json():
+        return jsonify(customers=customers, next=next_page)
+
+    return await render_template("customer/index.html", customers=customers, next_page=next_page)
+
+
+@app.route("/main/customers/create", methods=("GET", "POST",))
+async def customer_create():
+    """Create a new customer."""
+
+    if request.method == "POST":
+        form = await request.form
+        name = form["name"]
+        email = form["email"]
+        phone = form["phone"]
+        address = form["address"]
+
+        error = None
+        address_match = re.search(".*, [1-9][0-9][0-9][0-9]-[0-9][0-9][0-9] .*", address)
+
+        if not name:
+            error = "Name is required."
+
+        if not email:
+            error = "Email is required."
+
+        if not address_match:
+            error = "Address doesn't match with portuguese standards."
+
+        if error is not None:
+            await flash(error)
+        else:
+            cust_no = await cust_ids.next()
+            async with pool.connection() as conn:
+                async with conn.cursor(row_factory=namedtuple_row) as cur:
+                    await statements.execute_async(
+                        cur,
+                        "customer_create",
+                        {"cust_no": cust_no, "name": name, "email": email, "phone": phone, "address": address},
+                    )
+                await conn.commit()
+            return redirect(url_for("customer_index"))
+    return await render_template("customer/create.html")
+
+
+@app.route("/main/customers/<cust_no>/delete", methods=("POST",))
+async def customer_delete(cust_no):
+    """Delete the costumer, with all their orders."""
+
+    async with pool.connection() as conn:
+        async with conn.cursor(row_factory=namedtuple_row) as cur:
+            await cascade.delete_customers_async(cur, [cust_no])
+        await conn.commit()
+    return redirect(url_for("customer_index"))
+
+
+@app.route("/main/customers/delete", methods=("POST",))
+async def customer_bulk_delete():
+    """Purge many customers at once, given as a JSON list of customer numbers,
+    committing them in groups of cascade.BATCH_SIZE."""
+
+    cust_nos = cascade.keys(await request.get_json(silent=True), "cust_nos", int)
+    if cust_nos is None:
+        return jsonify({"message": 'Expected {"cust_nos": [customer number, ...]}.', "status": "error"}), 400
+
+    deleted = 0
+    async with pool.connection() as conn:
+        async with conn.cursor(row_factory=namedtuple_row) as cur:
+            for i in range(0, len(cust_nos), cascade.BATCH_SIZE):
+                async with conn.transaction():
+                    deleted += await cascade.delete_customers_async(cur, cust_nos[i:i + cascade.BATCH_SIZE])
+            log.debug(f"Deleted {deleted} customers.")
+    return jsonify({"deleted": deleted})
+
+#--------------------------------------------------------------------------------------------#
+
+
+@app.route("/main/orders", methods=("GET",))
+async def order_index():
+    """Show the orders, ordered by date, recent-old, one page at a time."""
+
+    size = pagination.page_size(request.args)
+    after = pagination.decode_cursor(
+        request.args.get("after"), ("infinity", 2147483647), (pagination.date_key, int)
+    )
+
+    async with pool.connection() as conn:
+        async with conn.cursor(row_factory=namedtuple_row) as cur:
+            await statements.execute_async(
+                cur,
+                "order_page",
+                {"date": after[0], "order_no": after[1], "limit": size + 1},
+            )
+            orders = await cur.fetchall()
+            log.debug(f"Found {cur.rowcount} rows.")
+    orders, next_page = pagination.split_page(orders, size, lambda row: [row.date, row.order_no])
+
+    if wants_json():
+        return jsonify(orders=orders, next=next_page)
+
+    return await render_template("order/index.html", orders=orders, next_page=next_page, live_events=True)
+
+
+@app.route("/main/orders/stream", methods=("GET",))
+async def order_stream():
+    """Push new, paid and deleted orders as Server-Sent Events."""
+
+    response = await make_response(
+        events.stream_async(DATABASE_URL),
+        {"Content-Type": "text/event-stream", "Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    # an event stream stays open indefinitely
+    response.timeout = None
+    return response
+
+
+@app.route("/main/login", methods=("GET", "POST",))
+async def orders_login():
+    """Asks for the customer number, of which orders you want to interact."""
+
+    if request.method == "POST":
+        cust_no = (await request.form)["cust_no"]
+
+        if not cust_no:
+            await flash("Customer ID is required.")
+        else:
+            return redirect(url_for("c_order_index", cust_no=cust_no))
+
+    return await render_template("pay/login.html")
+
+
+@app.route("/main/login/<cust_no>", methods=("GET",))
+async def c_order_index(cust_no):
+    """Show the orders from a specific customer, ordered by date, recent-old,
+    one page at a time."""
+
+    size = pagination.page_size(request.args)
+    after = pagination.decode_cursor(
+        request.args.get("after"), ("infinity", 2147483647), (pagination.date_key, int)
+    )
+
+    async with pool.connection() as conn:
+        async with conn.cursor(row_factory=namedtuple_row) as cur:
+            await statements.execute_async(
+                cur,
+                "customer_orders",
+                {"cust_no": cust_no, "date": after[0], "order_no": after[1], "limit": size + 1},
+            )
+            orders = await cur.fetchall()
+            log.debug(f"Found {cur.rowcount} rows.")
+    orders, next_page = pagination.split_page(orders, size, lambda row: [row.date, row.order_no])
+
+    if wants_json():
+        return jsonify(orders=orders, next=next_page)
+    return await render_template("pay/index.html", orders=orders, cust_no=cust_no, next_page=next_page)
+
+
+@app.route("/main/login/<cust_no>/<order_no>/info/pay", methods=("GET", "POST",))
+async def pay_order(cust_no, order_no):
+    """Pays the given order."""
+    async with pool.connection() as conn:
+        async with conn.cursor(row_factory=namedtuple_row) as cur:
+            await statements.execute_async(cur, "pay_order", {"order_no": order_no, "cust_no": cust_no})
+            await events.publish_async(cur, "paid", order_no, cust_no)
+        await conn.commit()
+    return redirect(url_for("c_order_index", cust_no=cust_no))
+
+
+@app.route("/main/login/<cust_no>/<order_no>/info", methods=("GET", "POST",))
+async def order_info(order_no, cust_no):
+    """Lists all the info from a specific order."""
+    async with pool.connection() as conn:
+        async with conn.cursor(row_factory=namedtuple_row) as cur:
+            await statements.execute_async(cur, "order_items", {"order_no": order_no})
+            containings = await cur.fetchall()
+            log.debug(f"Found {cur.rowcount} rows.")
+
+    total = containings[0].total_value if containings else 0
+    item_count = containings[0].item_count if containings else 0
+    paid = containings[0].paid if containings else False
+
+    if wants_json():
+        return jsonify(containings=containings, total=total, item_count=item_count, paid=paid)
+    return await render_template("pay/order_info.html", containings=containings, total=total, item_count=item_count, paid=paid, cust_no=cust_no, order_no=order_no)
+
+
+@app.route("/main/orders/create/<cust_no>", methods=("GET", "POST",))
+async def order_create(cust_no):
+    """Create a new order."""
+
+    products = (await catalog.get_async(("product", "list"), load_products))[::-1]
+
+    if wants_json() and request.method == "GET":
+        return jsonify(products)
+
+    if request.method == "POST":
+        qtys = (await request.form).getlist("qty")
+        items = [(product.sku, qty) for product, qty in zip(products, qtys) if int(qty) > 0]
+
+        if items:
+            order_no = await order_ids.next()
+            async with pool.connection() as conn:
+                async with conn.cursor(row_factory=namedtuple_row) as cur:
+                    await ingest.insert_orders_async(cur, [(order_no, cust_no, None, items)])
+                    await events.publish_async(cur, "created", order_no, cust_no)
+                await conn.commit()
+            if wants_json():
+                location = url_for("order_info", cust_no=cust_no, order_no=order_no)
+                return jsonify({"order_no": order_no, "cust_no": cust_no}), 201, {"Location": location}
+            return redirect(url_for("c_order_index", cust_no=cust_no))
+        if wants_json():
+            return jsonify({"message": "The order has no items.", "status": "error"}), 400
+
+    return await render_template("pay/for_order.html", products=products)
+
+
+@app.route("/main/orders/bulk", methods=("POST",))
+async def order_bulk_create():
+    """Create many orders at once, committing them in groups of ingest.BATCH_SIZE.
+
+    Expects {"orders": [{"cust_no": .., "date": .., "items": [{"sku": .., "qty": ..}]}]},
+    with "date" optional. If a group fails (an unknown customer or product),
+    the answer lists the orders of the groups committed before it.
+    """
+
+    try:
+        parsed = ingest.parse_orders(await request.get_json(silent=True))
+    except ingest.OrderError as e:
+        return jsonify({"message": str(e), "status": "error"}), 400
+    orders = [(await order_ids.next(), cust_no, date, items) for cust_no, date, items in parsed]
+
+    committed = []
+    async with pool.connection() as conn:
+        async with conn.cursor(row_factory=namedtuple_row) as cur:
+            for i in range(0, len(orders), ingest.BATCH_SIZE):
+                batch = orders[i:i + ingest.BATCH_SIZE]
+                try:
+                    async with conn.transaction():
+                        await ingest.insert_orders_async(cur, batch)
+                        await events.publish_many_async(cur, "created", [(order[0], order[1]) for order in batch])
+                except (psycopg.IntegrityError, psycopg.DataError) as e:
+                    log.debug(f"Created {len(committed)} orders before: {e}")
+                    return jsonify({"message": str(e), "status": "error", "order_nos": committed}), 400
+                committed += [order[0] for order in batch]
+            log.debug(f"Created {len(orders)} orders.")
+
+    return jsonify({"order_nos": committed}), 201
+
+
+@app.route("/main/login/<cust_no>/<order_no>/info/delete/<flag>", methods=("POST",))
+async def order_delete(cust_no, order_no, flag):
+    """Delete the order."""
+
+    async with pool.connection() as conn:
+        async with conn.cursor(row_factory=namedtuple_row) as cur:
+            await cascade.delete_order_async(cur, order_no)
+            await events.publish_async(cur, "deleted", order_no, cust_no)
+        await conn.commit()
+    if flag == 'customer':
+        return redirect(url_for("c_order_index", cust_no=cust_no))
+    return redirect(url_for("order_index"))
+
+
+@app.route("/reports/sales-cube", methods=("GET",))
+async def sales_cube():
+    """Sales of a year from the pre-aggregated cube, as in app.py."""
+
+    year = request.args.get("year", type=int) or datetime.date.today().year
+
+    async with pool.connection() as conn:
+        async with conn.cursor(row_factory=namedtuple_row) as cur:
+            await statements.execute_async(cur, "sales_totals", {"year": year})
+            totals = await cur.fetchall()
+
+            await statements.execute_async(cur, "sales_daily_average", {"year": year})
+            daily_average = await cur.fetchall()
+
+    return jsonify(year=year, totals=totals, daily_average=daily_average)
+
+
+@app.route("/search/customers", methods=("GET",))
+async def search_customers():
+    """Customers matching ?q= by number, name or email prefix, or fuzzily by name."""
+
+    term = request.args.get("q", "").strip()
+    if not term:
+        return jsonify({"message": "A search term (q) is required.", "status": "error"}), 400
+
+    async with pool.connection() as conn:
+        async with conn.cursor(row_factory=namedtuple_row) as cur:
+            await cur.execute(
+                search.SEARCH_CUSTOMERS, search.search_params(term, search.result_limit(request.args))
+            )
+            customers = await cur.fetchall()
+            log.debug(f"Found {cur.rowcount} rows.")
+    return jsonify(customers=customers)
+
+
+@app.route("/search/products", methods=("GET",))
+async def search_products():
+    """Products matching ?q= by EAN, name, SKU or EAN prefix, or fuzzily by name."""
+
+    term = request.args.get("q", "").strip()
+    if not term:
+        return jsonify({"message": "A search term (q) is required.", "status": "error"}), 400
+
+    async with pool.connection() as conn:
+        async with conn.cursor(row_factory=namedtuple_row) as cur:
+            await cur.execute(
+                search.SEARCH_PRODUCTS, search.search_params(term, search.result_limit(request.args))
+            )
+            products = await cur.fetchall()
+            log.debug(f"Found {cur.rowcount} rows.")
+    return jsonify(products=products)
+
+
+@app.route("/search/products/autocomplete", methods=("GET",))
+async def autocomplete_products():
+    """Products whose name or SKU starts with ?q=, from the in-memory catalog."""
+
+    async def load_index():
+        return search.PrefixIndex.for_products(await load_products())
+
+    index = await catalog.get_async(("product", "prefix"), load_index)
+    return jsonify(products=index.complete(request.args.get("q", "").strip(), search.result_limit(request.args)))
+
+
+@app.route("/ping", methods=("GET",))
+async def ping():
+    log.debug("ping!")
+    return jsonify({"message": "pong!", "status": "success"})
+
+
+if __name__ == "__main__":
+    app.run()
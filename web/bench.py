@@ -0,0 +1,349 @@
+#!/usr/bin/python3
+"""End-to-end HTTP load test.
+
+Starts the app (gunicorn, as deployed, or the Flask dev server), drives it
+with a mixed workload for a fixed time and writes per-endpoint throughput and
+latency percentiles, plus the pool wait times read from /metrics, to a JSON
+file. Two result files can then be compared:
+
+    python bench.py run --server gunicorn --output before.json
+    python bench.py run --server gunicorn --output after.json
+    python bench.py compare before.json after.json
+
+The database is whatever settings.DATABASE_URL points to; seed it first with
+``flask generate`` (or pass --generate SCALE). The workload writes to it:
+it pays orders, creates orders and deletes some of the orders it created.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# seconds to wait before reading /metrics, longer than metrics.FLUSH_INTERVAL
+METRICS_DELAY = 2
+
+# scenario -> relative weight; mostly reads, as in a shop
+WORKLOAD = {
+    "browse": 50,
+    "customer_session": 35,
+    "create_order": 12,
+    "delete_order": 3,
+}
+
+# rows come back as JSON arrays, in the column order of the route's query
+CUSTOMER_CUST_NO = 1  # name, cust_no, phone, address
+ORDER_ORDER_NO = 1  # cust_no, order_no, date, name
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Time the POST itself, not the page it redirects to."""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+opener = urllib.request.build_opener(NoRedirect)
+
+
+class Recorder:
+    """Latency and status of every request, by endpoint."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+
+    def add(self, endpoint, elapsed, ok):
+        with self.lock:
+            self.latencies.setdefault(endpoint, []).append(elapsed)
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def report(self, duration):
+        endpoints = {}
+        for endpoint, latencies in sorted(self.latencies.items()):
+            endpoints[endpoint] = summarize(latencies, duration)
+            endpoints[endpoint]["errors"] = self.errors.get(endpoint, 0)
+        every = [elapsed for latencies in self.latencies.values() for elapsed in latencies]
+        total = summarize(every, duration)
+        total["errors"] = sum(self.errors.values())
+        return {"total": total, "endpoints": endpoints}
+
+
+def summarize(latencies, duration):
+    """Count, req/s and latency percentiles in milliseconds."""
+    if len(latencies) > 1:
+        cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    else:
+        p50 = p95 = p99 = latencies[0] if latencies else 0.0
+    return {
+        "count": len(latencies),
+        "rps": round(len(latencies) / duration, 2),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+        "p50_ms": round(p50 * 1000, 2),
+        "p95_ms": round(p95 * 1000, 2),
+        "p99_ms": round(p99 * 1000, 2),
+    }
+
+
+class Client:
+    """One simulated user, running scenarios until the deadline."""
+
+    def __init__(self, base_url, recorder, rng, created):
+        self.base_url = base_url
+        self.recorder = recorder
+        self.rng = rng
+        # (cust_no, order_no) of orders created by the benchmark, shared by all clients
+        self.created = created
+
+    def request(self, endpoint, path, form=None, json_response=False):
+        data = urllib.parse.urlencode(form, doseq=True).encode() if form is not None else None
+        headers = {"Accept": "application/json"} if json_response else {}
+        req = urllib.request.Request(self.base_url + path, data=data, headers=headers)
+        start = time.perf_counter()
+        try:
+            with opener.open(req, timeout=30) as response:
+                body = response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            body = e.read()
+            status = e.code
+        except OSError:
+            body, status = b"", 0
+        self.recorder.add(endpoint, time.perf_counter() - start, 200 <= status < 400)
+        if json_response and 200 <= status < 300:
+            return json.loads(body)
+        return None
+
+    def browse(self, customers):
+        page = self.request("product_index", "/main/products", json_response=True)
+        if page and page["next"] and self.rng.random() < 0.3:
+            self.request("product_index", f"/main/products?after={page['next']}", json_response=True)
+
+    def customer_session(self, customers):
+        cust_no = self.rng.choice(customers)
+        self.request("orders_login", "/main/login", form={"cust_no": cust_no})
+        page = self.request("c_order_index", f"/main/login/{cust_no}", json_response=True)
+        if not page or not page["orders"]:
+            return
+        order_no = self.rng.choice(page["orders"])[ORDER_ORDER_NO]
+        info = self.request("order_info", f"/main/login/{cust_no}/{order_no}/info", json_response=True)
+        if info and not info["paid"]:
+            self.request("pay_order", f"/main/login/{cust_no}/{order_no}/info/pay", form={})
+
+    def create_order(self, customers):
+        cust_no = self.rng.choice(customers)
+        products = self.request("order_create", f"/main/orders/create/{cust_no}", json_response=True)
+        if not products:
+            return
+        qtys = [0] * len(products)
+        for i in self.rng.sample(range(len(products)), min(3, len(products))):
+            qtys[i] = self.rng.randint(1, 5)
+        order = self.request("order_create", f"/main/orders/create/{cust_no}", form={"qty": qtys}, json_response=True)
+        if order:
+            self.created.append((cust_no, order["order_no"]))
+
+    def delete_order(self, customers):
+        try:
+            cust_no, order_no = self.created.pop()
+        except IndexError:
+            return
+        self.request("order_delete", f"/main/login/{cust_no}/{order_no}/info/delete/customer", form={})
+
+    def run(self, customers, deadline):
+        scenarios = list(WORKLOAD)
+        weights = list(WORKLOAD.values())
+        while time.monotonic() < deadline:
+            getattr(self, self.rng.choices(scenarios, weights)[0])(customers)
+
+
+def fetch_json(url):
+    req = urllib.request.Request(url, headers={"Accept": "application/json"})
+    with urllib.request.urlopen(req, timeout=30) as response:
+        return json.loads(response.read())
+
+
+def pool_stats(base_url):
+    """The pool counters of /metrics, added up over every worker (see metrics.py).
+
+    Waits first for every worker to have written a snapshot of its figures
+    since the last request.
+    """
+    time.sleep(METRICS_DELAY)
+    with urllib.request.urlopen(base_url + "/metrics", timeout=30) as response:
+        text = response.read().decode()
+    stats = {}
+    for line in text.splitlines():
+        if line.startswith("db_pool_requests_"):
+            name, value = line.split()
+            stats[name] = float(value)
+    return stats
+
+
+def wait_until_up(base_url, server, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            sys.exit(f"Server exited with status {server.returncode}.")
+        try:
+            urllib.request.urlopen(base_url + "/ping", timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    sys.exit("Server did not come up.")
+
+
+def start_server(kind, port, workers):
+    if kind == "gunicorn":
+        # the other settings, threads included, come from gunicorn.conf.py as deployed
+        command = ["gunicorn", "wsgi:app", "--bind", f"127.0.0.1:{port}", "--workers", str(workers)]
+    else:
+        command = [sys.executable, "-m", "flask", "--app", "app", "run", "--port", str(port), "--with-threads"]
+    return subprocess.Popen(command, cwd=HERE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    if args.generate:
+        subprocess.check_call([sys.executable, "-m", "flask", "--app", "app", "generate", "--scale", str(args.generate)], cwd=HERE)
+
+    server = None
+    base_url = args.url
+    if args.server != "none":
+        base_url = f"http://127.0.0.1:{args.port}"
+        server = start_server(args.server, args.port, args.workers)
+    try:
+        if server:
+            wait_until_up(base_url, server)
+        customers = [row[CUSTOMER_CUST_NO] for row in fetch_json(base_url + "/main/customers?limit=500")["customers"]]
+        if not customers:
+            sys.exit("No customers; seed the database first.")
+
+        # warm up caches and connections without recording
+        warmup = Client(base_url, Recorder(), random.Random(args.seed), [])
+        warmup.run(customers, time.monotonic() + args.warmup)
+
+        before = pool_stats(base_url)
+        recorder = Recorder()
+        created = []
+        deadline = time.monotonic() + args.duration
+        clients = [
+            threading.Thread(
+                target=Client(base_url, recorder, random.Random(args.seed + i), created).run,
+                args=(customers, deadline),
+            )
+            for i in range(args.concurrency)
+        ]
+        start = time.monotonic()
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        duration = time.monotonic() - start
+        after = pool_stats(base_url)
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    waits = after.get("db_pool_requests_wait_ms_total", 0) - before.get("db_pool_requests_wait_ms_total", 0)
+    checkouts = after.get("db_pool_requests_num_total", 0) - before.get("db_pool_requests_num_total", 0)
+    results = {
+        "commit": git_commit(),
+        "server": args.server,
+        "workers": args.workers,
+        "concurrency": args.concurrency,
+        "duration_s": round(duration, 2),
+        **recorder.report(duration),
+        "pool": {
+            "checkouts": checkouts,
+            "queued": after.get("db_pool_requests_queued_total", 0) - before.get("db_pool_requests_queued_total", 0),
+            "wait_ms_total": waits,
+            "wait_ms_mean": round(waits / checkouts, 3) if checkouts else 0.0,
+        },
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print_report(results)
+
+
+def print_report(results):
+    print(f"{'endpoint':<16} {'count':>8} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'errors':>7}")
+    for endpoint, row in list(results["endpoints"].items()) + [("total", results["total"])]:
+        print(
+            f"{endpoint:<16} {row['count']:>8} {row['rps']:>8} {row['p50_ms']:>8} "
+            f"{row['p95_ms']:>8} {row['p99_ms']:>8} {row['errors']:>7}"
+        )
+    pool = results["pool"]
+    print(f"pool: {pool['checkouts']:.0f} checkouts, {pool['queued']:.0f} queued, {pool['wait_ms_mean']} ms mean wait")
+
+
+def compare(args):
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    print(f"{before['commit']} -> {after['commit']}")
+    print(f"{'endpoint':<16} {'req/s':>16} {'p95 ms':>20} {'p99 ms':>20}")
+    rows = [(name, before["endpoints"].get(name), row) for name, row in after["endpoints"].items()]
+    rows.append(("total", before["total"], after["total"]))
+    for endpoint, old, new in rows:
+        if old is None:
+            continue
+        print(
+            f"{endpoint:<16} {change(old['rps'], new['rps']):>16} "
+            f"{change(old['p95_ms'], new['p95_ms']):>20} {change(old['p99_ms'], new['p99_ms']):>20}"
+        )
+
+
+def change(old, new):
+    if not old:
+        return f"{new}"
+    return f"{new} ({(new - old) / old:+.0%})"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the benchmark")
+    run_parser.add_argument("--server", choices=("gunicorn", "flask", "none"), default="gunicorn",
+                            help="server to start; none benchmarks --url")
+    run_parser.add_argument("--url", default="http://127.0.0.1:5001", help="app to benchmark with --server none")
+    run_parser.add_argument("--port", type=int, default=5001)
+    run_parser.add_argument("--workers", type=int, default=3, help="gunicorn workers")
+    run_parser.add_argument("--concurrency", type=int, default=16, help="simulated users")
+    run_parser.add_argument("--duration", type=float, default=60, help="seconds measured")
+    run_parser.add_argument("--warmup", type=float, default=5, help="seconds before measuring")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--generate", type=float, metavar="SCALE", help="seed the database with flask generate first")
+    run_parser.add_argument("--output", default="bench.json")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser("compare", help="compare two result files")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""In-process read-through cache for query results.
+
+Keys are tuples whose first element names the table the value was read from,
+so every entry derived from a table can be dropped at once when it is written.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """A thread-safe cache whose entries expire after ``ttl`` seconds.
+
+    At most ``maxsize`` entries are kept; the least recently used one is
+    evicted first.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        # bumped on invalidation, so a load racing with a write is not stored
+        self.generations = {}
+        # bumped by clear(), for every table at once
+        self.epoch = 0
+
+    def get(self, key, load):
+        """Return the cached value for ``key``, calling ``load()`` on a miss."""
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end(key)
+                return entry[1]
+            generation = self.generation(key[0])
+
+        value = load()
+
+        with self.lock:
+            self.store(key, value, now, generation)
+        return value
+
+    async def get_async(self, key, load):
+        """get() with a coroutine function as ``load``."""
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end(key)
+                return entry[1]
+            generation = self.generation(key[0])
+
+        value = await load()
+
+        with self.lock:
+            self.store(key, value, now, generation)
+        return value
+
+    def generation(self, table):
+        return (self.epoch, self.generations.get(table, 0))
+
+    def store(self, key, value, now, generation):
+        if self.generation(key[0]) == generation:
+            self.entries[key] = (now + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, table):
+        """Drop every entry read from ``table``."""
+        with self.lock:
+            self.generations[table] = self.generations.get(table, 0) + 1
+            for key in [key for key in self.entries if key[0] == table]:
+                del self.entries[key]
+
+    def clear(self):
+        """Drop every entry."""
+        with self.lock:
+            self.epoch += 1
+            self.entries.clear()
@@ -0,0 +1,162 @@
+"""Set-based cascading deletes.
+
+Every function takes an open cursor and a list of keys and removes the whole
+footprint of those keys in a constant number of statements, whatever the
+number of rows involved. Committing is left to the caller.
+"""
+
+# keys per transaction for the bulk endpoints
+BATCH_SIZE = 500
+
+# tables written by delete_products() and delete_customers()
+PRODUCT_TABLES = ("pay", "process", "contains", "orders", "delivery", "supplier", "product")
+CUSTOMER_TABLES = ("pay", "process", "contains", "orders", "customer")
+# and by delete_supplier() and delete_order()
+SUPPLIER_TABLES = ("delivery", "supplier")
+ORDER_TABLES = ("pay", "process", "contains", "orders")
+
+# orders side: line items, then the orders they leave empty with their
+# payment and processing records
+DELETE_PRODUCT_ORDERS = """
+    WITH emptied AS (
+        SELECT order_no
+        FROM contains
+        WHERE order_no IN (SELECT order_no FROM contains WHERE sku = ANY(%(skus)s))
+        GROUP BY order_no
+        HAVING bool_and(sku = ANY(%(skus)s))
+    ),
+    deleted_pay AS (
+        DELETE FROM pay WHERE order_no IN (SELECT order_no FROM emptied)
+    ),
+    deleted_process AS (
+        DELETE FROM process WHERE order_no IN (SELECT order_no FROM emptied)
+    ),
+    deleted_contains AS (
+        DELETE FROM contains WHERE sku = ANY(%(skus)s)
+    )
+    DELETE FROM orders WHERE order_no IN (SELECT order_no FROM emptied);
+"""
+
+# catalog side: deliveries, suppliers and finally the products
+DELETE_PRODUCT_CATALOG = """
+    WITH deleted_delivery AS (
+        DELETE FROM delivery
+        USING supplier
+        WHERE delivery.TIN = supplier.TIN
+        AND supplier.SKU = ANY(%(skus)s)
+    ),
+    deleted_supplier AS (
+        DELETE FROM supplier WHERE SKU = ANY(%(skus)s)
+    )
+    DELETE FROM product WHERE SKU = ANY(%(skus)s);
+"""
+
+# a customer's orders with their line items, payment and processing records,
+# then the customer, in one statement; foreign keys are checked once all of
+# it is gone
+DELETE_CUSTOMERS = """
+    WITH doomed AS (
+        SELECT order_no FROM orders WHERE cust_no = ANY(%(cust_nos)s::integer[])
+    ),
+    deleted_pay AS (
+        DELETE FROM pay
+        WHERE order_no IN (SELECT order_no FROM doomed)
+        OR cust_no = ANY(%(cust_nos)s::integer[])
+    ),
+    deleted_process AS (
+        DELETE FROM process WHERE order_no IN (SELECT order_no FROM doomed)
+    ),
+    deleted_contains AS (
+        DELETE FROM contains WHERE order_no IN (SELECT order_no FROM doomed)
+    ),
+    deleted_orders AS (
+        DELETE FROM orders WHERE order_no IN (SELECT order_no FROM doomed)
+    )
+    DELETE FROM customer WHERE cust_no = ANY(%(cust_nos)s::integer[]);
+"""
+
+
+# a supplier and its deliveries
+DELETE_SUPPLIER = """
+    WITH deleted_delivery AS (
+        DELETE FROM delivery WHERE TIN = %(TIN)s
+    )
+    DELETE FROM supplier WHERE TIN = %(TIN)s;
+"""
+
+# an order with its line items, payment and processing records
+DELETE_ORDER = """
+    WITH deleted_pay AS (
+        DELETE FROM pay WHERE order_no = %(order_no)s
+    ),
+    deleted_process AS (
+        DELETE FROM process WHERE order_no = %(order_no)s
+    ),
+    deleted_contains AS (
+        DELETE FROM contains WHERE order_no = %(order_no)s
+    )
+    DELETE FROM orders WHERE order_no = %(order_no)s;
+"""
+
+
+def keys(payload, name, kind):
+    """The list of ``kind`` values under ``name`` in a JSON request body, or
+    None if the body is not such an object."""
+    if not isinstance(payload, dict):
+        return None
+    values = payload.get(name)
+    # exact, so that a bool does not pass for an int
+    if not isinstance(values, list) or any(type(value) is not kind for value in values):
+        return None
+    return values
+
+
+def delete_products(cur, skus):
+    """Delete the products and everything that depends on them.
+
+    Orders left without any line item are deleted too, together with their
+    payment and processing records. Returns the number of products deleted.
+    """
+    cur.execute(DELETE_PRODUCT_ORDERS, {"skus": skus})
+    cur.execute(DELETE_PRODUCT_CATALOG, {"skus": skus})
+    return cur.rowcount
+
+
+async def delete_products_async(cur, skus):
+    """delete_products for an async cursor."""
+    await cur.execute(DELETE_PRODUCT_ORDERS, {"skus": skus})
+    await cur.execute(DELETE_PRODUCT_CATALOG, {"skus": skus})
+    return cur.rowcount
+
+
+def delete_customers(cur, cust_nos):
+    """Delete the customers with their orders and everything that depends on
+    them. Returns the number of customers deleted."""
+    cur.execute(DELETE_CUSTOMERS, {"cust_nos": cust_nos})
+    return cur.rowcount
+
+
+async def delete_customers_async(cur, cust_nos):
+    """delete_customers for an async cursor."""
+    await cur.execute(DELETE_CUSTOMERS, {"cust_nos": cust_nos})
+    return cur.rowcount
+
+
+def delete_supplier(cur, TIN):
+    """Delete the supplier and its deliveries."""
+    cur.execute(DELETE_SUPPLIER, {"TIN": TIN})
+
+
+async def delete_supplier_async(cur, TIN):
+    """delete_supplier() for an async cursor."""
+    await cur.execute(DELETE_SUPPLIER, {"TIN": TIN})
+
+
+def delete_order(cur, order_no):
+    """Delete the order with its line items, payment and processing records."""
+    cur.execute(DELETE_ORDER, {"order_no": order_no})
+
+
+async def delete_order_async(cur, order_no):
+    """delete_order() for an async cursor."""
+    await cur.execute(DELETE_ORDER, {"order_no": order_no})
@@ -0,0 +1,157 @@
+"""Live order events, pushed to browsers as Server-Sent Events.
+
+The routes that create, pay or delete orders publish an event with
+pg_notify() in their own transaction, so it is only delivered if the write
+commits. The listener of each worker process (see notifications.py) hands
+every event to the Broadcaster, which fans it out to that worker's
+subscribers; open streams therefore cost no database connection of their
+own. Under WSGI each open stream does hold a worker thread, so at most
+MAX_STREAMS are served per worker; asgi.py has no such limit, and only its
+Orders page subscribes to the feed.
+
+An event is {"event": "created" | "paid" | "deleted", "order_no": .., "cust_no": ..}.
+"""
+import asyncio
+import json
+import logging
+import os
+import queue
+import threading
+
+import notifications
+
+CHANNEL = "order_events"
+PUBLISH = "SELECT pg_notify('order_events', %(payload)s);"
+PUBLISH_MANY = "SELECT pg_notify('order_events', p) FROM unnest(%(payloads)s::text[]) p;"
+# seconds before a browser reconnects, and between keep-alive comments
+RECONNECT_DELAY = 5
+KEEPALIVE = 15
+# events buffered per subscriber; a client that stops reading misses the rest
+QUEUE_SIZE = 100
+# open streams per WSGI worker, each of which holds one of its threads
+MAX_STREAMS = int(os.environ.get("MAX_EVENT_STREAMS", 2))
+
+log = logging.getLogger(__name__)
+
+
+def encode(event, order_no, cust_no):
+    return json.dumps({"event": event, "order_no": int(order_no), "cust_no": int(cust_no)})
+
+
+def payload(event, order_no, cust_no):
+    return {"payload": encode(event, order_no, cust_no)}
+
+
+def publish(cur, event, order_no, cust_no):
+    """Announce ``event`` on the order, once the current transaction commits."""
+    cur.execute(PUBLISH, payload(event, order_no, cust_no))
+
+
+async def publish_async(cur, event, order_no, cust_no):
+    """publish() for an async cursor."""
+    await cur.execute(PUBLISH, payload(event, order_no, cust_no))
+
+
+def payloads(event, orders):
+    return {"payloads": [encode(event, order_no, cust_no) for order_no, cust_no in orders]}
+
+
+def publish_many(cur, event, orders):
+    """publish() for every (order_no, cust_no) of ``orders``, in one statement."""
+    cur.execute(PUBLISH_MANY, payloads(event, orders))
+
+
+async def publish_many_async(cur, event, orders):
+    """publish_many() for an async cursor."""
+    await cur.execute(PUBLISH_MANY, payloads(event, orders))
+
+
+class Broadcaster(notifications.Handler):
+    """Calls every subscribed function with each event notified on CHANNEL."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = set()
+
+    def subscribe(self, deliver):
+        with self.lock:
+            self.subscribers.add(deliver)
+
+    def unsubscribe(self, deliver):
+        with self.lock:
+            self.subscribers.discard(deliver)
+
+    def notify(self, payload):
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            # sent by something other than publish(); skip it, keep listening
+            log.warning(f"Ignored malformed order event {payload!r}.")
+            return
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for deliver in subscribers:
+            deliver(event)
+
+
+broadcaster = Broadcaster()
+notifications.on(CHANNEL, broadcaster)
+
+
+# streams open in this (WSGI) process, released when the response is closed
+stream_slots = threading.BoundedSemaphore(MAX_STREAMS)
+
+
+def format_event(event):
+    return f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+
+
+def stream(conninfo):
+    """Yield the order events as an SSE stream, until the client goes away."""
+    events = queue.Queue(QUEUE_SIZE)
+
+    def deliver(event):
+        try:
+            events.put_nowait(event)
+        except queue.Full:
+            pass
+
+    notifications.start(conninfo)
+    broadcaster.subscribe(deliver)
+    try:
+        yield f"retry: {RECONNECT_DELAY * 1000}\n\n"
+        while True:
+            try:
+                yield format_event(events.get(timeout=KEEPALIVE))
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+    finally:
+        broadcaster.unsubscribe(deliver)
+
+
+async def stream_async(conninfo):
+    """stream() for an asyncio server."""
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue(QUEUE_SIZE)
+
+    def put(event):
+        try:
+            events.put_nowait(event)
+        except asyncio.QueueFull:
+            pass
+
+    def deliver(event):
+        # called from the listener thread
+        loop.call_soon_threadsafe(put, event)
+
+    notifications.start(conninfo)
+    broadcaster.subscribe(deliver)
+    try:
+        yield f"retry: {RECONNECT_DELAY * 1000}\n\n"
+        while True:
+            try:
+                yield format_event(await asyncio.wait_for(events.get(), KEEPALIVE))
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+    finally:
+        broadcaster.unsubscribe(deliver)
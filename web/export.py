@@ -0,0 +1,53 @@
+"""Bulk CSV export through COPY ... TO STDOUT.
+
+The bytes produced by the server are passed to the client as they arrive,
+without building rows in Python.
+"""
+from flask import Response
+from flask import stream_with_context
+
+# exported tables and the query behind each one; orders take a date range
+QUERIES = {
+    "orders": """
+        SELECT order_no, cust_no, date
+        FROM orders
+        WHERE date >= COALESCE(%(from)s::date, '-infinity')
+        AND date <= COALESCE(%(to)s::date, 'infinity')
+        ORDER BY order_no
+    """,
+    "contains": """
+        SELECT order_no, SKU, qty
+        FROM contains
+        ORDER BY order_no, SKU
+    """,
+    "customers": """
+        SELECT cust_no, name, email, phone, address
+        FROM customer
+        ORDER BY cust_no
+    """,
+    "products": """
+        SELECT SKU, name, description, price, ean
+        FROM product
+        ORDER BY SKU
+    """,
+}
+
+
+def stream_csv(pool, table, params):
+    """Respond with ``table`` as CSV, header included."""
+
+    def generate():
+        with pool.connection() as conn:
+            with conn.cursor() as cur:
+                with cur.copy(
+                    f"COPY ({QUERIES[table]}) TO STDOUT WITH (FORMAT csv, HEADER)",
+                    params,
+                ) as copy:
+                    for data in copy:
+                        yield bytes(data)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/csv",
+        headers={"Content-Disposition": f"attachment; filename={table}.csv"},
+    )
@@ -0,0 +1,276 @@
+"""Synthetic data at a given scale factor, loaded with COPY.
+
+Scale factor 1 is 100 000 orders from 10 000 customers over 1 000 products;
+every table grows linearly with it, so scale 100 gives 10M orders. The data
+is skewed the way a shop's is:
+
+- product popularity follows a Zipf law (``skew`` is its exponent);
+- so does the number of orders per customer, giving a few heavy customers;
+- order dates are seasonal, with a December peak, a summer bump and quiet
+  Sundays.
+
+The integrity constraints of the schema are respected: employees are adults
+(RI-1), every workplace is exactly one of office or warehouse (RI-2, checked
+at commit) and every order has at least one line item (RI-3, checked at
+commit), which is why orders are loaded together with their items, one chunk
+per transaction.
+
+Generated products, suppliers, employees and workplaces have fixed keys, so
+load into a schema that has none of them yet. Customers and orders are
+numbered from whole blocks taken from their sequences, as the workers do (see
+ids.py), so the generator can run next to the app without reusing ids.
+"""
+import bisect
+import datetime
+import itertools
+import math
+import random
+
+# rows per unit of scale
+CUSTOMERS = 10_000
+ORDERS = 100_000
+PRODUCTS = 1_000
+SUPPLIERS = 500
+EMPLOYEES = 200
+WAREHOUSES = 20
+OFFICES = 10
+
+# orders loaded per transaction
+CHUNK_SIZE = 50_000
+
+PAID_RATIO = 0.8
+PROCESSED_RATIO = 0.9
+MAX_ITEMS = 8
+
+DEPARTMENTS = ("Sales", "Logistics", "Finance", "Marketing", "Support")
+CITIES = (
+    ("LISBOA", "1"), ("PORTO", "4"), ("COIMBRA", "3"), ("BRAGA", "4"),
+    ("FARO", "8"), ("CASCAIS", "2"), ("AVEIRO", "3"), ("EVORA", "7"),
+)
+# weight of each city, mostly Lisbon and Porto
+CITY_WEIGHTS = (30, 20, 8, 8, 5, 6, 5, 3)
+STREETS = ("Rua", "Avenida", "Largo", "Travessa", "Alameda", "Praça")
+FIRST_NAMES = (
+    "Ana", "André", "Beatriz", "Bruno", "Carla", "Diogo", "Eduardo", "Filipa",
+    "Gonçalo", "Helena", "Inês", "João", "Leonor", "Madalena", "Nuno", "Olivia",
+    "Pedro", "Rita", "Sofia", "Tiago",
+)
+LAST_NAMES = (
+    "Antunes", "Correia", "Cruz", "Fernandes", "Ferreira", "Gomes", "Lima",
+    "Matias", "Miranda", "Nunes", "Pires", "Ribeiro", "Rocha", "Santos", "Sousa",
+)
+PRODUCT_WORDS = (
+    "Lamp", "Chair", "Table", "Kettle", "Blender", "Shelf", "Mirror", "Rug",
+    "Pillow", "Blanket", "Vase", "Clock", "Mug", "Plate", "Bowl", "Pan",
+)
+# relative weight of each month (January first) and weekday (Monday first)
+MONTH_WEIGHTS = (0.8, 0.7, 0.8, 0.9, 1.0, 1.0, 1.2, 1.1, 0.9, 1.0, 1.3, 1.9)
+WEEKDAY_WEIGHTS = (1.0, 1.0, 1.0, 1.1, 1.3, 1.2, 0.6)
+
+
+def counts(scale):
+    """Number of rows of every generated entity at ``scale``."""
+
+    def scaled(n):
+        return max(1, math.ceil(n * scale))
+
+    return {
+        "customers": scaled(CUSTOMERS),
+        "orders": scaled(ORDERS),
+        "products": scaled(PRODUCTS),
+        "suppliers": scaled(SUPPLIERS),
+        "employees": scaled(EMPLOYEES),
+        "warehouses": scaled(WAREHOUSES),
+        "offices": scaled(OFFICES),
+    }
+
+
+def zipf_weights(n, skew):
+    """Cumulative Zipf weights of ranks 1..n."""
+    return list(itertools.accumulate(1 / rank ** skew for rank in range(1, n + 1)))
+
+
+def pick(rng, population, cum_weights):
+    return population[bisect.bisect(cum_weights, rng.random() * cum_weights[-1])]
+
+
+def seasonal_days(first, last):
+    """Every day from ``first`` to ``last`` with the cumulative seasonal weights."""
+    days = [first + datetime.timedelta(n) for n in range((last - first).days + 1)]
+    weights = [MONTH_WEIGHTS[day.month - 1] * WEEKDAY_WEIGHTS[day.weekday()] for day in days]
+    return days, list(itertools.accumulate(weights))
+
+
+RESERVE_QUERY = """
+    SELECT nextval(%(seq)s), increment_by
+    FROM pg_sequences, generate_series(1, (%(count)s + increment_by - 1) / increment_by)
+    WHERE schemaname = current_schema() AND sequencename = %(seq)s;
+"""
+
+
+def reserve_ids(cur, sequence, count):
+    """Take enough blocks of ``sequence`` for ``count`` ids, and iterate over them.
+
+    The blocks are consecutive unless a worker takes one at the same time.
+    """
+    blocks = sorted(cur.execute(RESERVE_QUERY, {"seq": sequence, "count": count}).fetchall())
+    ids = (start + i for start, size in blocks for i in range(size))
+    return itertools.islice(ids, count)
+
+
+def address(rng, n):
+    city, region = rng.choices(CITIES, CITY_WEIGHTS)[0]
+    return (
+        f"{rng.choice(STREETS)} {rng.choice(LAST_NAMES)} {n % 300 + 1}, "
+        f"{region}{rng.randint(100, 999)}-{rng.randint(0, 999):03d} {city}"
+    )
+
+
+def person(rng):
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+
+def copy_rows(cur, table, columns, rows):
+    with cur.copy(f"COPY {table} ({', '.join(columns)}) FROM STDIN") as copy:
+        for row in rows:
+            copy.write_row(row)
+
+
+def load_reference(cur, rng, n, cust_nos, first_date):
+    """Load everything but orders; return the SKUs, customer numbers and SSNs."""
+
+    warehouses = [f"Armazém {i}, {address(rng, i).split(', ', 1)[1]}" for i in range(1, n["warehouses"] + 1)]
+    offices = [f"Escritório {i}, {address(rng, i).split(', ', 1)[1]}" for i in range(1, n["offices"] + 1)]
+    workplaces = warehouses + offices
+    # distinct coordinates, all of them in mainland Portugal
+    copy_rows(
+        cur, "workplace", ("address", "lat", "long"),
+        (
+            (workplace, f"{37 + i * 0.0001:.6f}", f"{-9 + i * 0.0001:.6f}")
+            for i, workplace in enumerate(workplaces)
+        ),
+    )
+    copy_rows(cur, "warehouse", ("address",), ((w,) for w in warehouses))
+    copy_rows(cur, "office", ("address",), ((o,) for o in offices))
+    cur.executemany(
+        "INSERT INTO department (name) VALUES (%s) ON CONFLICT DO NOTHING;",
+        [(d,) for d in DEPARTMENTS],
+    )
+
+    ssns = [f"G{i:09d}" for i in range(1, n["employees"] + 1)]
+    today = datetime.date.today()
+    copy_rows(
+        cur, "employee", ("ssn", "TIN", "bdate", "name"),
+        (
+            # between 19 and 65 years old, comfortably inside RI-1
+            (ssn, f"E{i:09d}", today - datetime.timedelta(rng.randint(19 * 366, 65 * 365)), person(rng))
+            for i, ssn in enumerate(ssns, 1)
+        ),
+    )
+    copy_rows(
+        cur, "works", ("ssn", "name", "address"),
+        ((ssn, rng.choice(DEPARTMENTS), rng.choice(workplaces)) for ssn in ssns),
+    )
+
+    skus = [f"G{i:08d}" for i in range(1, n["products"] + 1)]
+    copy_rows(
+        cur, "product", ("SKU", "name", "description", "price", "ean"),
+        (
+            (
+                sku,
+                f"{rng.choice(PRODUCT_WORDS)} {i}",
+                f"Generated product {i}.",
+                f"{rng.lognormvariate(3, 1):.2f}",
+                5600000000000 + i,
+            )
+            for i, sku in enumerate(skus, 1)
+        ),
+    )
+
+    tins = [f"S{i:09d}" for i in range(1, n["suppliers"] + 1)]
+    copy_rows(
+        cur, "supplier", ("TIN", "name", "address", "SKU", "date"),
+        (
+            (tin, f"Fornecedor {i}", address(rng, i), rng.choice(skus), first_date - datetime.timedelta(rng.randint(0, 3650)))
+            for i, tin in enumerate(tins, 1)
+        ),
+    )
+    copy_rows(
+        cur, "delivery", ("address", "TIN"),
+        ((warehouse, tin) for tin in tins for warehouse in rng.sample(warehouses, min(2, len(warehouses)))),
+    )
+
+    copy_rows(
+        cur, "customer", ("cust_no", "name", "email", "phone", "address"),
+        (
+            (cust_no, person(rng), f"customer{cust_no}@example.com", f"9{rng.randint(10_000_000, 99_999_999)}", address(rng, cust_no))
+            for cust_no in cust_nos
+        ),
+    )
+    return skus, cust_nos, ssns
+
+
+def order_chunk(rng, order_nos, cust_nos, cust_weights, skus, sku_weights, days, day_weights, ssns):
+    """The orders, contains, pay and process rows of the given orders."""
+    orders, contains, pay, process = [], [], [], []
+    for order_no in order_nos:
+        cust_no = pick(rng, cust_nos, cust_weights)
+        orders.append((order_no, cust_no, pick(rng, days, day_weights)))
+
+        items = {pick(rng, skus, sku_weights) for _ in range(rng.randint(1, MAX_ITEMS))}
+        contains.extend((order_no, sku, rng.randint(1, 5)) for sku in sorted(items))
+
+        if rng.random() < PAID_RATIO:
+            pay.append((order_no, cust_no))
+            if rng.random() < PROCESSED_RATIO:
+                process.append((rng.choice(ssns), order_no))
+    return orders, contains, pay, process
+
+
+def date_range(first_date=None, last_date=None):
+    """The order dates, by default from January 1st two years back to today."""
+    last_date = last_date or datetime.date.today()
+    first_date = first_date or last_date.replace(year=last_date.year - 2, month=1, day=1)
+    if first_date > last_date:
+        raise ValueError(f"The first order date {first_date} is after the last one, {last_date}.")
+    return first_date, last_date
+
+
+def generate(conn, scale=1.0, skew=1.0, seed=0, first_date=None, last_date=None, log=None):
+    """Generate and load a dataset of ``scale`` into the database of ``conn``."""
+    rng = random.Random(seed)
+    n = counts(scale)
+    first_date, last_date = date_range(first_date, last_date)
+
+    with conn.cursor() as cur:
+        # reserved up front; a failed load only leaves them unused, nextval() is never undone
+        cust_nos = list(reserve_ids(cur, "cust_no_seq", n["customers"]))
+        order_nos = reserve_ids(cur, "order_no_seq", n["orders"])
+        conn.commit()
+
+        with conn.transaction():
+            skus, cust_nos, ssns = load_reference(cur, rng, n, cust_nos, first_date)
+        if log:
+            log.info(f"Loaded {n['products']} products and {n['customers']} customers.")
+
+        sku_weights = zipf_weights(len(skus), skew)
+        # heavy customers at random numbers, not just the lowest ones
+        cust_nos = rng.sample(cust_nos, len(cust_nos))
+        cust_weights = zipf_weights(len(cust_nos), skew)
+        days, day_weights = seasonal_days(first_date, last_date)
+
+        while True:
+            chunk = list(itertools.islice(order_nos, CHUNK_SIZE))
+            if not chunk:
+                break
+            orders, contains, pay, process = order_chunk(
+                rng, chunk, cust_nos, cust_weights, skus, sku_weights, days, day_weights, ssns,
+            )
+            with conn.transaction():
+                copy_rows(cur, "orders", ("order_no", "cust_no", "date"), orders)
+                copy_rows(cur, "contains", ("order_no", "SKU", "qty"), contains)
+                copy_rows(cur, "pay", ("order_no", "cust_no"), pay)
+                copy_rows(cur, "process", ("ssn", "order_no"), process)
+            if log:
+                log.info(f"Loaded orders {chunk[0]} to {chunk[-1]}.")
+    return n
@@ -0,0 +1,27 @@
+"""gunicorn settings, read from the working directory (see the Procfile)."""
+import glob
+import os
+import tempfile
+
+# load the app once, before forking, and share it between the workers
+# (see pools.py for why that is safe)
+preload_app = True
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+threads = 8
+
+# where the workers share their metrics (see metrics.py); set before the app is loaded
+os.environ.setdefault("METRICS_DIR", tempfile.mkdtemp(prefix="metrics-"))
+
+
+def on_starting(server):
+    # figures of a previous run of the server would be added to this one's
+    for path in glob.glob(os.path.join(os.environ["METRICS_DIR"], "*.json")):
+        os.remove(path)
+
+
+def worker_exit(server, worker):
+    import metrics
+    from app import pool
+
+    metrics.stop(pool)
+    pool.close()
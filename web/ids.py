@@ -0,0 +1,76 @@
+"""Allocation of order_no and cust_no from database sequences.
+
+Each sequence is created with INCREMENT BY n (see migrations/001_id_sequences.sql),
+so a single nextval() reserves n consecutive ids for this worker, which are then
+handed out locally without touching the database. A block is never shared
+with a forked child, which would hand out the same ids as its parent.
+"""
+import asyncio
+import os
+import threading
+
+
+BLOCK_QUERY = """
+    SELECT nextval(%(seq)s), increment_by
+    FROM pg_sequences
+    WHERE schemaname = current_schema() AND sequencename = %(seq)s;
+"""
+
+
+class IdAllocator:
+    """Hands out unique ids from a sequence, prefetching one block at a time."""
+
+    def __init__(self, pool, sequence):
+        self.pool = pool
+        self.sequence = sequence
+        self.lock = threading.Lock()
+        self.next_id = 0
+        self.block_end = 0
+        os.register_at_fork(after_in_child=self.after_fork)
+
+    def after_fork(self):
+        self.lock = threading.Lock()
+        self.next_id = 0
+        self.block_end = 0
+
+    def fetch_block(self):
+        with self.pool.connection() as conn:
+            start, size = conn.execute(BLOCK_QUERY, {"seq": self.sequence}).fetchone()
+        self.next_id = start
+        self.block_end = start + size
+
+    def next(self):
+        """Return the next free id, fetching a new block when this one is used up."""
+        with self.lock:
+            if self.next_id >= self.block_end:
+                self.fetch_block()
+            allocated = self.next_id
+            self.next_id += 1
+            return allocated
+
+
+class AsyncIdAllocator:
+    """IdAllocator for an AsyncConnectionPool."""
+
+    def __init__(self, pool, sequence):
+        self.pool = pool
+        self.sequence = sequence
+        self.lock = asyncio.Lock()
+        self.next_id = 0
+        self.block_end = 0
+
+    async def fetch_block(self):
+        async with self.pool.connection() as conn:
+            cur = await conn.execute(BLOCK_QUERY, {"seq": self.sequence})
+            start, size = await cur.fetchone()
+        self.next_id = start
+        self.block_end = start + size
+
+    async def next(self):
+        """Return the next free id, fetching a new block when this one is used up."""
+        async with self.lock:
+            if self.next_id >= self.block_end:
+                await self.fetch_block()
+            allocated = self.next_id
+            self.next_id += 1
+            return allocated
@@ -0,0 +1,216 @@
+"""Bulk CSV import through COPY ... FROM STDIN.
+
+The file is copied as text into a temporary staging table, validated there
+with a few set-based UPDATEs that record a rejection reason per row, and the
+accepted rows are merged into the target table, all in one transaction.
+The first line of the file is a header naming the columns present.
+
+Conditions only compare staged values as text, since a row that failed an
+earlier check may still hold a value that does not cast; dates are checked
+with is_valid_date() (migrations/010_import_date_check.sql), which never
+raises. A file COPY cannot parse at all raises CSVError.
+"""
+import psycopg
+
+# Portuguese postcode, as checked by customer_create
+ADDRESS_PATTERN = ".*, [1-9][0-9][0-9][0-9]-[0-9][0-9][0-9] .*"
+
+TABLES = {
+    "products": {
+        # written by the merge; product prices also update order totals
+        "tables": ("product", "orders"),
+        "columns": ("sku", "name", "description", "price", "ean"),
+        "required": {"sku": "SKU is required.", "name": "Name is required.", "price": "Price is required."},
+        "checks": (
+            ("length(sku) > 25 OR length(name) > 200", "Value too long."),
+            ("price !~ '^[0-9]{1,8}(\\.[0-9]{1,2})?$'", "Price is required to be numeric."),
+            ("ean !~ '^[0-9]{1,13}$'", "EAN is required to be numeric."),
+            (
+                "EXISTS (SELECT 1 FROM product WHERE product.ean::text = staging.ean"
+                " AND product.SKU <> staging.sku)",
+                "EAN already used by another product.",
+            ),
+        ),
+        "unique": ("sku", "ean"),
+        "merge": """
+            INSERT INTO product (SKU, name, description, price, ean)
+            SELECT sku, name, description, price::numeric, ean::numeric
+            FROM staging WHERE reason IS NULL
+            ON CONFLICT (SKU) DO UPDATE
+            SET name = EXCLUDED.name, description = EXCLUDED.description,
+            price = EXCLUDED.price, ean = EXCLUDED.ean;
+        """,
+    },
+    "customers": {
+        "tables": ("customer",),
+        "columns": ("cust_no", "name", "email", "phone", "address"),
+        "required": {"name": "Name is required.", "email": "Email is required."},
+        "checks": (
+            ("length(name) > 80 OR length(email) > 254 OR length(phone) > 15 OR length(address) > 255", "Value too long."),
+            (f"address IS NULL OR address !~ '{ADDRESS_PATTERN}'", "Address doesn't match with portuguese standards."),
+            ("cust_no !~ '^[0-9]{1,9}$'", "Customer ID is required to be numeric."),
+            (
+                "cust_no IS NOT NULL AND NOT EXISTS"
+                " (SELECT 1 FROM customer WHERE customer.cust_no::text = staging.cust_no)",
+                "Unknown customer ID; leave it empty to create a new customer.",
+            ),
+            (
+                "EXISTS (SELECT 1 FROM customer WHERE customer.email = staging.email"
+                " AND customer.cust_no::text IS DISTINCT FROM staging.cust_no)",
+                "Email already used by another customer.",
+            ),
+        ),
+        "unique": ("cust_no", "email"),
+        # new customers get ids in whole blocks of cust_no_seq (see ids.py)
+        "prepare": """
+            WITH seq AS (
+                SELECT increment_by AS inc
+                FROM pg_sequences
+                WHERE schemaname = current_schema() AND sequencename = 'cust_no_seq'
+            ),
+            new AS (
+                SELECT line, row_number() OVER (ORDER BY line) - 1 AS i
+                FROM staging WHERE reason IS NULL AND cust_no IS NULL
+            ),
+            blocks AS (
+                SELECT b - 1 AS b, nextval('cust_no_seq') AS start
+                FROM seq, generate_series(1, ((SELECT count(*) FROM new) + seq.inc - 1) / seq.inc) b
+            )
+            UPDATE staging SET cust_no = (blocks.start + new.i %% seq.inc)::text
+            FROM new, seq, blocks
+            WHERE staging.line = new.line AND blocks.b = new.i / seq.inc;
+        """,
+        "merge": """
+            INSERT INTO customer (cust_no, name, email, phone, address)
+            SELECT cust_no::integer, name, email, phone, address
+            FROM staging WHERE reason IS NULL
+            ON CONFLICT (cust_no) DO UPDATE
+            SET name = EXCLUDED.name, email = EXCLUDED.email,
+            phone = EXCLUDED.phone, address = EXCLUDED.address;
+        """,
+    },
+    "suppliers": {
+        "tables": ("supplier",),
+        "columns": ("tin", "name", "address", "sku", "date"),
+        "required": {"tin": "TIN is required.", "name": "Name is required."},
+        "checks": (
+            ("length(tin) > 20 OR length(name) > 200 OR length(address) > 255", "Value too long."),
+            (
+                "date !~ '^[0-9]{4}-(0[1-9]|1[0-2])-(0[1-9]|[12][0-9]|3[01])$' OR NOT is_valid_date(date)",
+                "Date must be YYYY-MM-DD.",
+            ),
+            (
+                "sku IS NOT NULL AND NOT EXISTS (SELECT 1 FROM product WHERE product.SKU = staging.sku)",
+                "Unknown product SKU.",
+            ),
+        ),
+        "unique": ("tin",),
+        "merge": """
+            INSERT INTO supplier (TIN, name, address, SKU, date)
+            SELECT tin, name, address, sku, date::date
+            FROM staging WHERE reason IS NULL
+            ON CONFLICT (TIN) DO UPDATE
+            SET name = EXCLUDED.name, address = EXCLUDED.address,
+            SKU = EXCLUDED.SKU, date = EXCLUDED.date;
+        """,
+    },
+}
+
+
+class CSVError(Exception):
+    """The file cannot be imported at all (as opposed to rejected rows)."""
+
+
+def read_header(stream, table):
+    """Return the columns named in the first line of ``stream``."""
+    header = stream.readline()
+    if isinstance(header, bytes):
+        try:
+            header = header.decode()
+        except UnicodeDecodeError:
+            raise CSVError("The file is not UTF-8 encoded.")
+    columns = [column.strip().lower() for column in header.strip().split(",")]
+    unknown = [column for column in columns if column not in TABLES[table]["columns"]]
+    if unknown:
+        raise CSVError(f"Unknown columns: {', '.join(unknown)}.")
+    return columns
+
+
+def import_csv(conn, table, stream, chunk_size=65536):
+    """Import the CSV in ``stream`` into ``table`` and commit.
+
+    Returns {"accepted": <row count>, "rejected": [{"line": .., "reason": ..}]},
+    with line numbers counted from the header line.
+    """
+    spec = TABLES[table]
+    columns = read_header(stream, table)
+
+    with conn.transaction():
+        with conn.cursor() as cur:
+            cur.execute(
+                f"""
+                CREATE TEMP TABLE staging (
+                line BIGINT GENERATED ALWAYS AS IDENTITY (START WITH 2),
+                {", ".join(f"{column} TEXT" for column in spec["columns"])},
+                reason TEXT
+                ) ON COMMIT DROP;
+                """
+            )
+            try:
+                with cur.copy(f"COPY staging ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)") as copy:
+                    while True:
+                        data = stream.read(chunk_size)
+                        if not data:
+                            break
+                        copy.write(data)
+            except psycopg.DataError as e:
+                # a wrong number of columns, unbalanced quotes or a bad encoding
+                raise CSVError(f"Malformed CSV: {e}")
+
+            # empty fields mean "not given"
+            cur.execute(
+                f"""
+                UPDATE staging SET
+                {", ".join(f"{column} = NULLIF(trim({column}), '')" for column in spec["columns"])};
+                """
+            )
+            for column, reason in spec["required"].items():
+                cur.execute(
+                    f"UPDATE staging SET reason = %s WHERE reason IS NULL AND {column} IS NULL;",
+                    (reason,),
+                )
+            for condition, reason in spec["checks"]:
+                cur.execute(
+                    f"UPDATE staging SET reason = %s WHERE reason IS NULL AND ({condition});",
+                    (reason,),
+                )
+            for column in spec["unique"]:
+                cur.execute(
+                    f"""
+                    UPDATE staging SET reason = %s
+                    FROM (
+                        SELECT line, row_number() OVER (PARTITION BY {column} ORDER BY line) AS n
+                        FROM staging WHERE reason IS NULL AND {column} IS NOT NULL
+                    ) ranked
+                    WHERE staging.line = ranked.line AND ranked.n > 1;
+                    """,
+                    (f"Duplicate {column} in file.",),
+                )
+
+            if "prepare" in spec:
+                cur.execute(spec["prepare"], {})
+            cur.execute(spec["merge"])
+            accepted = cur.rowcount
+            rejected = cur.execute(
+                """
+                SELECT line, reason
+                FROM staging
+                WHERE reason IS NOT NULL
+                ORDER BY line;
+                """
+            ).fetchall()
+
+    return {
+        "accepted": accepted,
+        "rejected": [{"line": line, "reason": reason} for line, reason in rejected],
+    }
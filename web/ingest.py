@@ -0,0 +1,91 @@
+"""Batched writes of orders and their line items.
+
+``executemany`` sends all the rows of a batch in pipeline mode (psycopg uses it
+automatically when libpq supports it), so a batch costs one round trip per
+table instead of one per row.
+"""
+import datetime
+
+# Orders committed together by the bulk ingestion endpoint.
+BATCH_SIZE = 500
+
+
+INSERT_ORDER = """
+    INSERT INTO orders (order_no, cust_no, date)
+    VALUES (%s, %s, COALESCE(%s::date, CURRENT_DATE))
+"""
+
+INSERT_ITEM = """
+    INSERT INTO contains (order_no, sku, qty)
+    VALUES (%s, %s, %s)
+"""
+
+
+class OrderError(ValueError):
+    """The body of a bulk order request is malformed."""
+
+
+def parse_orders(payload):
+    """Check a bulk order request body, before anything is written.
+
+    Returns a (cust_no, date, items) tuple per order, with the items of
+    quantity 0 left out; raises OrderError on any malformed order.
+    """
+    if not isinstance(payload, dict) or not isinstance(payload.get("orders"), list):
+        raise OrderError('Expected {"orders": [...]}.')
+    orders = []
+    for n, order in enumerate(payload["orders"]):
+        if not isinstance(order, dict) or type(order.get("cust_no")) is not int:
+            raise OrderError(f"Order {n} needs an integer cust_no.")
+        date = order.get("date")
+        if date is not None:
+            try:
+                datetime.date.fromisoformat(date)
+            except (TypeError, ValueError):
+                raise OrderError(f"Order {n} has an invalid date.")
+        if not isinstance(order.get("items"), list):
+            raise OrderError(f"Order {n} needs a list of items.")
+        items = []
+        for item in order["items"]:
+            if (
+                not isinstance(item, dict)
+                or not isinstance(item.get("sku"), str)
+                or type(item.get("qty")) is not int
+                or item["qty"] < 0
+            ):
+                raise OrderError(f"Order {n} has an item without a SKU and a quantity.")
+            if item["qty"] > 0:
+                items.append((item["sku"], item["qty"]))
+        if not items:
+            raise OrderError("Every order needs at least one item.")
+        orders.append((order["cust_no"], date, items))
+    return orders
+
+
+def order_rows(orders):
+    return [(order_no, cust_no, date) for order_no, cust_no, date, items in orders]
+
+
+def item_rows(orders):
+    return [
+        (order_no, sku, qty)
+        for order_no, cust_no, date, items in orders
+        for sku, qty in items
+    ]
+
+
+def insert_orders(cur, orders):
+    """Insert orders given as (order_no, cust_no, date, items) tuples.
+
+    ``items`` is a list of (sku, qty) pairs and a ``date`` of None means today.
+    The deferred RI-3 check only runs at commit, so orders and line items can
+    be written table by table within the same transaction.
+    """
+    cur.executemany(INSERT_ORDER, order_rows(orders))
+    cur.executemany(INSERT_ITEM, item_rows(orders))
+
+
+async def insert_orders_async(cur, orders):
+    """insert_orders for an async cursor."""
+    await cur.executemany(INSERT_ORDER, order_rows(orders))
+    await cur.executemany(INSERT_ITEM, item_rows(orders))
@@ -0,0 +1,48 @@
+"""Cross-worker cache invalidation over LISTEN/NOTIFY.
+
+Migration 007 makes every statement that writes to a cached table send
+NOTIFY table_changed '<table> <version>' (the version since migration 008,
+taken once per transaction since 009). The listener of each worker process
+(see notifications.py) hands these to an Invalidator, which invalidates that
+table in the worker's caches; so a write handled by any worker, or made
+outside the app, evicts the entries of all of them. It also keeps the
+TableVersions of the worker (see versions.py) up to date. The write routes
+still invalidate their own worker's caches and versions directly
+(tables_changed() in app.py), so their redirect never shows stale data.
+"""
+import notifications
+
+CHANNEL = "table_changed"
+
+
+class Invalidator(notifications.Handler):
+    """Invalidates ``caches`` and updates ``versions`` on every table_changed
+    notification."""
+
+    def __init__(self, caches, versions=None):
+        self.caches = caches
+        self.versions = versions
+
+    def connected(self, conn):
+        # notifications sent while not listening are lost
+        for cache in self.caches:
+            cache.clear()
+        if self.versions is not None:
+            self.versions.load(conn)
+
+    def notify(self, payload):
+        table, *version = payload.split()
+        for cache in self.caches:
+            cache.invalidate(table)
+        if self.versions is not None and version:
+            self.versions.update(table, version[0])
+
+    def disconnected(self):
+        if self.versions is not None:
+            self.versions.clear()
+
+
+def listen(caches, versions=None):
+    """Keep ``caches`` and ``versions`` up to date from the listener of each
+    worker, once notifications.start() runs there."""
+    notifications.on(CHANNEL, Invalidator(caches, versions))
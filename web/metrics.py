@@ -0,0 +1,297 @@
+"""Request, query and pool metrics in the Prometheus text format.
+
+Each worker process keeps its own figures, but a scrape of /metrics reaches a
+single worker, so every process of the server reports the figures of all of
+them. When METRICS_DIR is set (gunicorn.conf.py sets it for the workers it
+forks), each process writes a snapshot of its figures to a file of its own
+there every FLUSH_INTERVAL seconds, and /metrics adds up the snapshots of
+every process. Those of exited workers are kept, so that counters never go
+back, but their pool gauges are not counted. Without METRICS_DIR, /metrics
+shows the figures of the process that serves it.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+import psycopg
+
+import slowlog
+from perprocess import PerProcessThread
+
+log = logging.getLogger(__name__)
+
+METRICS_DIR = os.environ.get("METRICS_DIR")
+# seconds between the snapshots of a process; figures of other processes may be this old
+FLUSH_INTERVAL = 1
+
+# seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names, values, extra=()):
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{value}"' for name, value in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """A monotonically increasing value per combination of labels."""
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def inc(self, values=(), amount=1):
+        with self.lock:
+            self.series[values] = self.series.get(values, 0) + amount
+
+    def snapshot(self):
+        with self.lock:
+            return [[list(values), total] for values, total in self.series.items()]
+
+    @staticmethod
+    def merge(series, snapshot):
+        for values, total in snapshot:
+            values = tuple(values)
+            series[values] = series.get(values, 0) + total
+
+    def render(self, series):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for values, total in sorted(series.items()):
+            lines.append(f"{self.name}{format_labels(self.labels, values)} {total}")
+        return lines
+
+
+class Histogram:
+    """Observations counted into cumulative buckets per combination of labels."""
+
+    def __init__(self, name, help, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        # label values -> [count per bucket..., +Inf count, sum]
+        self.series = {}
+
+    def observe(self, values, amount):
+        with self.lock:
+            counts = self.series.get(values)
+            if counts is None:
+                counts = self.series[values] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if amount <= bound:
+                    counts[i] += 1
+            counts[-2] += 1
+            counts[-1] += amount
+
+    def snapshot(self):
+        with self.lock:
+            return [[list(values), list(counts)] for values, counts in self.series.items()]
+
+    @staticmethod
+    def merge(series, snapshot):
+        for values, counts in snapshot:
+            values = tuple(values)
+            total = series.get(values)
+            series[values] = counts if total is None else [a + b for a, b in zip(total, counts)]
+
+    def render(self, series):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for values, counts in sorted(series.items()):
+            for bound, count in zip(self.buckets, counts):
+                labels = format_labels(self.labels, values, (("le", bound),))
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = format_labels(self.labels, values, (("le", "+Inf"),))
+            lines.append(f"{self.name}_bucket{labels} {counts[-2]}")
+            labels = format_labels(self.labels, values)
+            lines.append(f"{self.name}_sum{labels} {counts[-1]}")
+            lines.append(f"{self.name}_count{labels} {counts[-2]}")
+        return lines
+
+
+request_latency = Histogram(
+    "http_request_duration_seconds",
+    "Time spent handling a request.",
+    ("endpoint", "method", "status"),
+)
+query_latency = Histogram(
+    "db_query_duration_seconds",
+    "Time spent executing a statement, by statement.",
+    ("query",),
+)
+query_rows = Counter(
+    "db_query_rows_total",
+    "Rows returned or affected, by statement.",
+    ("query",),
+)
+statement_prepares = Counter(
+    "db_prepared_statements_total",
+    "Executions of registered statements, by whether the connection had them prepared already.",
+    ("statement", "result"),
+)
+METRICS = (request_latency, query_latency, query_rows, statement_prepares)
+
+# pool.get_stats() keys exported as gauges, and those exported as counters
+POOL_GAUGES = ("pool_min", "pool_max", "pool_size", "pool_available", "requests_waiting")
+POOL_COUNTERS = (
+    "requests_num",
+    "requests_queued",
+    "requests_wait_ms",
+    "requests_errors",
+    "connections_num",
+    "connections_ms",
+    "connections_errors",
+    "connections_lost",
+    "usage_ms",
+    "returns_bad",
+)
+
+
+def query_label(query):
+    """The statement text on one line, short enough to be a label."""
+    if isinstance(query, bytes):
+        query = query.decode()
+    return " ".join(str(query).split())[:100]
+
+
+class InstrumentedCursor(psycopg.Cursor):
+    """Cursor timing every statement it executes, and reporting slow ones to
+    the slow-query log."""
+
+    def execute(self, query, params=None, **kwargs):
+        start = time.perf_counter()
+        try:
+            super().execute(query, params, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.record(query, elapsed)
+        slowlog.check(self.connection, query, params, elapsed)
+        return self
+
+    def executemany(self, query, params_seq, **kwargs):
+        start = time.perf_counter()
+        try:
+            super().executemany(query, params_seq, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.record(query, elapsed)
+        slowlog.check(self.connection, query, None, elapsed, explainable=False)
+
+    def record(self, query, elapsed):
+        label = (query_label(query),)
+        query_latency.observe(label, elapsed)
+        if self.rowcount > 0:
+            query_rows.inc(label, self.rowcount)
+
+
+def snapshot(pool, live=True):
+    """The figures of this process; the pool gauges only while it is ``live``."""
+    stats = pool.get_stats()
+    return {
+        "metrics": {metric.name: metric.snapshot() for metric in METRICS},
+        "gauges": {key: stats.get(key, 0) for key in POOL_GAUGES} if live else {},
+        "counters": {key: stats.get(key, 0) for key in POOL_COUNTERS},
+    }
+
+
+# this process's snapshot file; named after its start too, as pids are reused
+snapshot_path = None
+
+
+def flush(pool, live=True):
+    """Write the snapshot of this process to METRICS_DIR."""
+    global snapshot_path
+    if snapshot_path is None or not snapshot_path.startswith(f"{METRICS_DIR}/{os.getpid()}-"):
+        snapshot_path = f"{METRICS_DIR}/{os.getpid()}-{time.time_ns()}.json"
+    temporary = snapshot_path + ".tmp"
+    with open(temporary, "w") as f:
+        json.dump(snapshot(pool, live), f)
+    # atomic, so a reader never sees half a snapshot
+    os.replace(temporary, snapshot_path)
+
+
+def read_snapshots():
+    snapshots = []
+    for name in os.listdir(METRICS_DIR):
+        if name.endswith(".json"):
+            try:
+                with open(os.path.join(METRICS_DIR, name)) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                # removed or replaced while listing
+                continue
+    return snapshots
+
+
+class Flusher(threading.Thread):
+    """Writes the snapshot of this process every FLUSH_INTERVAL seconds."""
+
+    def __init__(self, pool):
+        super().__init__(name="metrics-flush", daemon=True)
+        self.pool = pool
+
+    def run(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            try:
+                flush(self.pool)
+            except OSError as e:
+                log.warning(f"Could not write metrics snapshot: {e}")
+
+
+flusher = PerProcessThread(Flusher)
+
+
+def start(pool):
+    """Start writing snapshots of this process, if METRICS_DIR is set and it
+    has not already."""
+    if METRICS_DIR is not None:
+        flusher.start(pool)
+
+
+def stop(pool):
+    """Write the last snapshot of this process, without its pool gauges."""
+    if METRICS_DIR is not None and flusher.started():
+        flush(pool, live=False)
+
+
+def render(pool):
+    """All the metrics, in the Prometheus text exposition format."""
+    if METRICS_DIR is None:
+        snapshots = [snapshot(pool)]
+    else:
+        # our own figures up to date, the others at most FLUSH_INTERVAL old
+        start(pool)
+        flush(pool)
+        snapshots = read_snapshots()
+
+    lines = []
+    for metric in METRICS:
+        series = {}
+        for snap in snapshots:
+            metric.merge(series, snap["metrics"].get(metric.name, ()))
+        lines += metric.render(series)
+
+    gauges = {key: sum(snap["gauges"].get(key, 0) for snap in snapshots) for key in POOL_GAUGES}
+    counters = {key: sum(snap["counters"].get(key, 0) for snap in snapshots) for key in POOL_COUNTERS}
+    for key in POOL_GAUGES:
+        name = "db_" + key if key.startswith("pool_") else "db_pool_" + key
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {gauges[key]}")
+    lines.append("# HELP db_pool_in_use Connections currently lent to requests.")
+    lines.append("# TYPE db_pool_in_use gauge")
+    lines.append(f"db_pool_in_use {gauges['pool_size'] - gauges['pool_available']}")
+    for key in POOL_COUNTERS:
+        lines.append(f"# TYPE db_pool_{key}_total counter")
+        lines.append(f"db_pool_{key}_total {counters[key]}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,117 @@
+"""Versioned schema migrations for the web app.
+
+Migrations are the numbered ``*.sql`` files in ``migrations/``; each one is
+applied once, in order, and recorded in ``schema_migrations``.
+
+A migration normally runs in a single transaction. One whose first line is
+``-- migrate: no-transaction`` runs statement by statement in autocommit
+instead, as CREATE INDEX CONCURRENTLY requires. A failure leaves the earlier
+statements applied and the migration unrecorded, so it runs again in full
+next time: its statements must be safe to repeat.
+
+IF NOT EXISTS alone does not make CREATE INDEX CONCURRENTLY safe to repeat: a
+failed or interrupted build leaves an invalid index behind (pg_index.indisvalid
+is false), which the next attempt would then skip. So after each statement any
+invalid index of the schema is dropped and the statement run once more; if an
+index is still invalid, MigrationError is raised and the migration is not
+recorded.
+
+Such a migration is split into statements on every ";", so none of them may
+contain one (in a string literal, a function body or a DO block); keep those
+in transactional migrations.
+"""
+import os
+
+from psycopg import sql
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), "migrations")
+NO_TRANSACTION = "-- migrate: no-transaction"
+
+INVALID_INDEXES = """
+    SELECT pg_namespace.nspname, pg_class.relname
+    FROM pg_index
+    INNER JOIN pg_class ON pg_class.oid = pg_index.indexrelid
+    INNER JOIN pg_namespace ON pg_namespace.oid = pg_class.relnamespace
+    WHERE NOT pg_index.indisvalid AND pg_namespace.nspname = current_schema();
+"""
+
+
+class MigrationError(Exception):
+    """A migration could not be applied completely."""
+
+
+def available_migrations():
+    """Return (version, path) for every migration file, in order."""
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        if filename.endswith(".sql"):
+            version = filename.split("_", 1)[0]
+            migrations.append((version, os.path.join(MIGRATIONS_DIR, filename)))
+    return migrations
+
+
+def applied_migrations(conn):
+    """Return the set of versions already recorded in the database."""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations(
+        version VARCHAR(20) PRIMARY KEY,
+        applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+        """
+    )
+    return {row[0] for row in conn.execute("SELECT version FROM schema_migrations;")}
+
+
+def upgrade(conn, log):
+    """Apply every pending migration, each one in its own transaction
+    (unless marked no-transaction)."""
+    done = applied_migrations(conn)
+    conn.commit()
+    for version, path in available_migrations():
+        if version in done:
+            continue
+        with open(path) as f:
+            code = f.read()
+        transactional = not code.startswith(NO_TRANSACTION)
+        if not transactional:
+            apply_without_transaction(conn, code, log)
+        with conn.transaction():
+            if transactional:
+                conn.execute(code)
+            conn.execute(
+                "INSERT INTO schema_migrations (version) VALUES (%s);", (version,)
+            )
+        log.info(f"Applied migration {os.path.basename(path)}.")
+
+
+def invalid_indexes(conn):
+    """Return (schema, name) of the indexes a failed concurrent build left behind."""
+    return conn.execute(INVALID_INDEXES).fetchall()
+
+
+def apply_without_transaction(conn, code, log):
+    """Run each statement of ``code`` on its own, in autocommit, rebuilding
+    the indexes it leaves invalid."""
+    code = "\n".join(line for line in code.splitlines() if not line.strip().startswith("--"))
+    conn.autocommit = True
+    try:
+        for statement in code.split(";"):
+            if not statement.strip():
+                continue
+            conn.execute(statement)
+            invalid = invalid_indexes(conn)
+            if not invalid:
+                continue
+            for schema, name in invalid:
+                log.warning(f"Dropping invalid index {schema}.{name}.")
+                conn.execute(
+                    sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {}").format(sql.Identifier(schema, name))
+                )
+            conn.execute(statement)
+            invalid = invalid_indexes(conn)
+            if invalid:
+                names = ", ".join(f"{schema}.{name}" for schema, name in invalid)
+                raise MigrationError(f"Indexes left invalid: {names}.")
+    finally:
+        conn.autocommit = False
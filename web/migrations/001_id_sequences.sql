@@ -0,0 +1,8 @@
+-- Sequences backing order_no and cust_no allocation (see ids.py).
+-- Each nextval() reserves a block of INCREMENT BY ids for one worker.
+
+CREATE SEQUENCE IF NOT EXISTS order_no_seq INCREMENT BY 20;
+SELECT setval('order_no_seq', COALESCE(MAX(order_no), 0) + 1, false) FROM orders;
+
+CREATE SEQUENCE IF NOT EXISTS cust_no_seq INCREMENT BY 20;
+SELECT setval('cust_no_seq', COALESCE(MAX(cust_no), 0) + 1, false) FROM customer;
@@ -0,0 +1,123 @@
+-- product_sales backed by a summary table kept up to date by triggers,
+-- instead of a view re-joining pay, orders, contains, product and customer
+-- (with DISTINCT and ORDER BY) on every read. The columns are unchanged, so
+-- the OLAP queries of db-03 run as before.
+
+CREATE TABLE IF NOT EXISTS product_sales_summary(
+order_no INTEGER NOT NULL,
+sku VARCHAR(25) NOT NULL,
+qty INTEGER NOT NULL,
+total_price NUMERIC(12, 2) NOT NULL,
+year INTEGER NOT NULL,
+month INTEGER NOT NULL,
+day_of_month INTEGER NOT NULL,
+day_of_week INTEGER NOT NULL,
+city VARCHAR(255),
+PRIMARY KEY (order_no, sku)
+);
+
+DROP VIEW IF EXISTS product_sales;
+CREATE VIEW product_sales AS
+    SELECT sku, order_no, qty, total_price, year, month, day_of_month, day_of_week, city
+        FROM product_sales_summary;
+
+-- Recompute the summary rows of the given orders from the base tables.
+CREATE OR REPLACE FUNCTION refresh_product_sales(order_nos INTEGER[]) RETURNS VOID AS $$
+BEGIN
+  DELETE FROM product_sales_summary WHERE order_no = ANY(order_nos);
+  INSERT INTO product_sales_summary
+    (order_no, sku, qty, total_price, year, month, day_of_month, day_of_week, city)
+  SELECT order_no, SKU,
+  COALESCE(qty, 0),
+  COALESCE(qty*price, 0),
+  EXTRACT(YEAR FROM date),
+  EXTRACT(MONTH FROM date),
+  EXTRACT(DAY FROM date),
+  EXTRACT(DOW FROM date),
+  SUBSTRING(address, POSITION(',' IN address)+11)
+      FROM pay JOIN orders USING (order_no, cust_no)
+      JOIN contains USING (order_no)
+      JOIN product USING (SKU)
+      JOIN customer USING (cust_no)
+      WHERE order_no = ANY(order_nos);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Statement-level triggers: one refresh per statement, for all the orders it touched.
+CREATE OR REPLACE FUNCTION product_sales_pay_changed() RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    PERFORM refresh_product_sales(ARRAY(SELECT order_no FROM new_rows));
+  ELSIF TG_OP = 'DELETE' THEN
+    PERFORM refresh_product_sales(ARRAY(SELECT order_no FROM old_rows));
+  ELSE
+    PERFORM refresh_product_sales(ARRAY(SELECT order_no FROM new_rows UNION SELECT order_no FROM old_rows));
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION product_sales_contains_changed() RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    PERFORM refresh_product_sales(ARRAY(SELECT DISTINCT order_no FROM new_rows));
+  ELSIF TG_OP = 'DELETE' THEN
+    PERFORM refresh_product_sales(ARRAY(SELECT DISTINCT order_no FROM old_rows));
+  ELSE
+    PERFORM refresh_product_sales(ARRAY(SELECT order_no FROM new_rows UNION SELECT order_no FROM old_rows));
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION product_sales_price_changed() RETURNS TRIGGER AS $$
+BEGIN
+  PERFORM refresh_product_sales(ARRAY(
+    SELECT DISTINCT order_no
+    FROM contains JOIN new_rows USING (SKU)
+    JOIN old_rows USING (SKU)
+    WHERE new_rows.price IS DISTINCT FROM old_rows.price));
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION product_sales_address_changed() RETURNS TRIGGER AS $$
+BEGIN
+  PERFORM refresh_product_sales(ARRAY(
+    SELECT order_no
+    FROM orders JOIN new_rows USING (cust_no)
+    JOIN old_rows USING (cust_no)
+    WHERE new_rows.address IS DISTINCT FROM old_rows.address));
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER product_sales_pay_insert AFTER INSERT ON pay
+ REFERENCING NEW TABLE AS new_rows
+ FOR EACH STATEMENT EXECUTE FUNCTION product_sales_pay_changed();
+CREATE TRIGGER product_sales_pay_update AFTER UPDATE ON pay
+ REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows
+ FOR EACH STATEMENT EXECUTE FUNCTION product_sales_pay_changed();
+CREATE TRIGGER product_sales_pay_delete AFTER DELETE ON pay
+ REFERENCING OLD TABLE AS old_rows
+ FOR EACH STATEMENT EXECUTE FUNCTION product_sales_pay_changed();
+
+CREATE TRIGGER product_sales_contains_insert AFTER INSERT ON contains
+ REFERENCING NEW TABLE AS new_rows
+ FOR EACH STATEMENT EXECUTE FUNCTION product_sales_contains_changed();
+CREATE TRIGGER product_sales_contains_update AFTER UPDATE ON contains
+ REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows
+ FOR EACH STATEMENT EXECUTE FUNCTION product_sales_contains_changed();
+CREATE TRIGGER product_sales_contains_delete AFTER DELETE ON contains
+ REFERENCING OLD TABLE AS old_rows
+ FOR EACH STATEMENT EXECUTE FUNCTION product_sales_contains_changed();
+
+CREATE TRIGGER product_sales_price_update AFTER UPDATE ON product
+ REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows
+ FOR EACH STATEMENT EXECUTE FUNCTION product_sales_price_changed();
+CREATE TRIGGER product_sales_address_update AFTER UPDATE ON customer
+ REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows
+ FOR EACH STATEMENT EXECUTE FUNCTION product_sales_address_changed();
+
+-- Backfill from the orders already paid.
+SELECT refresh_product_sales(ARRAY(SELECT order_no FROM pay));
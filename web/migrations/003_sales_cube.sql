@@ -0,0 +1,76 @@
+-- Permanent date dimension and pre-aggregated sales cube behind
+-- /reports/sales-cube, replacing the calendar table the OLAP queries of
+-- db-03 drop and rebuild on every run.
+
+CREATE TABLE IF NOT EXISTS date_dim(
+date DATE PRIMARY KEY,
+year INTEGER NOT NULL,
+month INTEGER NOT NULL,
+day_of_month INTEGER NOT NULL,
+day_of_week INTEGER NOT NULL
+);
+
+INSERT INTO date_dim (date, year, month, day_of_month, day_of_week)
+SELECT d, EXTRACT(YEAR FROM d), EXTRACT(MONTH FROM d), EXTRACT(DAY FROM d), EXTRACT(DOW FROM d)
+    FROM (SELECT i::date AS d
+            FROM GENERATE_SERIES('2000-01-01', '2099-12-31', '1 day'::interval) i) AS dates
+ON CONFLICT (date) DO NOTHING;
+
+CREATE INDEX IF NOT EXISTS date_dim_year_idx ON date_dim (year);
+
+-- product_sales summed per day, product and city.
+CREATE TABLE IF NOT EXISTS sales_cube(
+year INTEGER NOT NULL,
+month INTEGER NOT NULL,
+day_of_month INTEGER NOT NULL,
+day_of_week INTEGER NOT NULL,
+sku VARCHAR(25) NOT NULL,
+city VARCHAR(255) NOT NULL,
+qty BIGINT NOT NULL,
+total_price NUMERIC(14, 2) NOT NULL,
+PRIMARY KEY (year, month, day_of_month, sku, city)
+);
+
+-- Apply the rows added to / removed from product_sales_summary as deltas.
+CREATE OR REPLACE FUNCTION sales_cube_summary_changed() RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    INSERT INTO sales_cube AS c (year, month, day_of_month, day_of_week, sku, city, qty, total_price)
+    SELECT year, month, day_of_month, day_of_week, sku, COALESCE(city, ''), SUM(qty), SUM(total_price)
+        FROM new_rows
+        GROUP BY year, month, day_of_month, day_of_week, sku, COALESCE(city, '')
+    ON CONFLICT (year, month, day_of_month, sku, city) DO UPDATE
+    SET qty = c.qty + EXCLUDED.qty, total_price = c.total_price + EXCLUDED.total_price;
+  ELSE
+    UPDATE sales_cube AS c
+    SET qty = c.qty - d.qty, total_price = c.total_price - d.total_price
+    FROM (SELECT year, month, day_of_month, sku, COALESCE(city, '') AS city,
+          SUM(qty) AS qty, SUM(total_price) AS total_price
+            FROM old_rows
+            GROUP BY year, month, day_of_month, sku, COALESCE(city, '')) AS d
+    WHERE (c.year, c.month, c.day_of_month, c.sku, c.city)
+        = (d.year, d.month, d.day_of_month, d.sku, d.city);
+    DELETE FROM sales_cube AS c
+    USING (SELECT DISTINCT year, month, day_of_month, sku, COALESCE(city, '') AS city
+            FROM old_rows) AS d
+    WHERE (c.year, c.month, c.day_of_month, c.sku, c.city)
+        = (d.year, d.month, d.day_of_month, d.sku, d.city)
+    AND c.qty = 0 AND c.total_price = 0;
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER sales_cube_summary_insert AFTER INSERT ON product_sales_summary
+ REFERENCING NEW TABLE AS new_rows
+ FOR EACH STATEMENT EXECUTE FUNCTION sales_cube_summary_changed();
+CREATE TRIGGER sales_cube_summary_delete AFTER DELETE ON product_sales_summary
+ REFERENCING OLD TABLE AS old_rows
+ FOR EACH STATEMENT EXECUTE FUNCTION sales_cube_summary_changed();
+
+-- Backfill.
+INSERT INTO sales_cube (year, month, day_of_month, day_of_week, sku, city, qty, total_price)
+SELECT year, month, day_of_month, day_of_week, sku, COALESCE(city, ''), SUM(qty), SUM(total_price)
+    FROM product_sales_summary
+    GROUP BY year, month, day_of_month, day_of_week, sku, COALESCE(city, '')
+ON CONFLICT DO NOTHING;
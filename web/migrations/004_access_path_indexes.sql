@@ -0,0 +1,30 @@
+-- migrate: no-transaction
+-- Indexes for the access paths of the routes (see plans.py, which checks that
+-- the hot queries use them). Built CONCURRENTLY so orders and contains stay
+-- writable while they build; btree scans backwards, so the (date, order_no)
+-- keys also serve the newest-first listings.
+
+-- c_order_index: a customer's orders, newest first; the listing also reads
+-- total_value and item_count (006) from the table, so this is not covering
+CREATE INDEX CONCURRENTLY IF NOT EXISTS orders_cust_no_date_idx ON orders (cust_no, date, order_no);
+
+-- order_index: every order, newest first
+CREATE INDEX CONCURRENTLY IF NOT EXISTS orders_date_idx ON orders (date, order_no);
+
+-- product_delete: line items and orders of a product
+CREATE INDEX CONCURRENTLY IF NOT EXISTS contains_sku_idx ON contains (sku, order_no);
+
+-- customer_delete and the pay foreign key to customer
+CREATE INDEX CONCURRENTLY IF NOT EXISTS pay_cust_no_idx ON pay (cust_no);
+
+-- order_delete and the cascades: processing records of an order
+CREATE INDEX CONCURRENTLY IF NOT EXISTS process_order_no_idx ON process (order_no);
+
+-- product_delete: suppliers of a product
+CREATE INDEX CONCURRENTLY IF NOT EXISTS supplier_sku_idx ON supplier (SKU);
+
+-- supplier_delete: deliveries of a supplier
+CREATE INDEX CONCURRENTLY IF NOT EXISTS delivery_tin_idx ON delivery (TIN);
+
+-- product_index: the catalog by name
+CREATE INDEX CONCURRENTLY IF NOT EXISTS product_name_idx ON product (name, SKU);
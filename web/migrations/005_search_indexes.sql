@@ -0,0 +1,15 @@
+-- migrate: no-transaction
+-- Indexes behind /search/customers and /search/products (see search.py):
+-- text_pattern_ops btrees for case-insensitive prefix matches (LIKE 'ab%'
+-- whatever the collation) and trigram GIN indexes for fuzzy name matches.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS customer_name_prefix_idx ON customer (lower(name) text_pattern_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS customer_email_prefix_idx ON customer (lower(email) text_pattern_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS customer_name_trgm_idx ON customer USING gin (name gin_trgm_ops);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS product_name_prefix_idx ON product (lower(name) text_pattern_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS product_sku_prefix_idx ON product (lower(SKU) text_pattern_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS product_ean_prefix_idx ON product ((ean::text) text_pattern_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS product_name_trgm_idx ON product USING gin (name gin_trgm_ops);
@@ -0,0 +1,68 @@
+-- orders.total_value (sum of qty*price) and orders.item_count (sum of qty)
+-- kept up to date by triggers, so listings and order_info read them instead
+-- of aggregating contains. Orders are inserted before their line items (the
+-- deferred RI-3 order_contains_trigger only checks at commit), so they start
+-- at 0 and the contains triggers fill them in.
+--
+-- Existing orders are filled in by `flask backfill-order-totals`, in batches.
+
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS total_value NUMERIC(12, 2) NOT NULL DEFAULT 0;
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS item_count INTEGER NOT NULL DEFAULT 0;
+
+-- Recompute the totals of the given orders from contains and product.
+CREATE OR REPLACE FUNCTION refresh_order_totals(order_nos INTEGER[]) RETURNS VOID AS $$
+BEGIN
+  UPDATE orders
+  SET total_value = totals.total_value, item_count = totals.item_count
+  FROM (
+    SELECT order_no,
+    COALESCE(SUM(qty*price), 0) AS total_value,
+    COALESCE(SUM(qty), 0) AS item_count
+    FROM unnest(order_nos) AS touched(order_no)
+    LEFT JOIN contains USING (order_no)
+    LEFT JOIN product USING (SKU)
+    GROUP BY order_no
+  ) totals
+  WHERE orders.order_no = totals.order_no
+  AND (orders.total_value, orders.item_count) IS DISTINCT FROM (totals.total_value, totals.item_count);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Statement-level triggers: one refresh per statement, for all the orders it touched.
+CREATE OR REPLACE FUNCTION order_totals_contains_changed() RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    PERFORM refresh_order_totals(ARRAY(SELECT DISTINCT order_no FROM new_rows));
+  ELSIF TG_OP = 'DELETE' THEN
+    PERFORM refresh_order_totals(ARRAY(SELECT DISTINCT order_no FROM old_rows));
+  ELSE
+    PERFORM refresh_order_totals(ARRAY(SELECT order_no FROM new_rows UNION SELECT order_no FROM old_rows));
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION order_totals_price_changed() RETURNS TRIGGER AS $$
+BEGIN
+  PERFORM refresh_order_totals(ARRAY(
+    SELECT DISTINCT order_no
+    FROM contains JOIN new_rows USING (SKU)
+    JOIN old_rows USING (SKU)
+    WHERE new_rows.price IS DISTINCT FROM old_rows.price));
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER order_totals_contains_insert AFTER INSERT ON contains
+ REFERENCING NEW TABLE AS new_rows
+ FOR EACH STATEMENT EXECUTE FUNCTION order_totals_contains_changed();
+CREATE TRIGGER order_totals_contains_update AFTER UPDATE ON contains
+ REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows
+ FOR EACH STATEMENT EXECUTE FUNCTION order_totals_contains_changed();
+CREATE TRIGGER order_totals_contains_delete AFTER DELETE ON contains
+ REFERENCING OLD TABLE AS old_rows
+ FOR EACH STATEMENT EXECUTE FUNCTION order_totals_contains_changed();
+
+CREATE TRIGGER order_totals_price_update AFTER UPDATE ON product
+ REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows
+ FOR EACH STATEMENT EXECUTE FUNCTION order_totals_price_changed();
@@ -0,0 +1,26 @@
+-- Every statement writing to a table cached by the web app sends
+-- NOTIFY table_changed '<table>', whoever runs it (a worker, a CLI command,
+-- psql). Notifications are delivered on commit, with duplicates within a
+-- transaction folded into one; see invalidation.py for the listeners.
+
+CREATE OR REPLACE FUNCTION notify_table_changed() RETURNS TRIGGER AS $$
+BEGIN
+  PERFORM pg_notify('table_changed', TG_TABLE_NAME);
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER product_notify_changed AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON product
+ FOR EACH STATEMENT EXECUTE FUNCTION notify_table_changed();
+CREATE TRIGGER supplier_notify_changed AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON supplier
+ FOR EACH STATEMENT EXECUTE FUNCTION notify_table_changed();
+CREATE TRIGGER delivery_notify_changed AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON delivery
+ FOR EACH STATEMENT EXECUTE FUNCTION notify_table_changed();
+CREATE TRIGGER customer_notify_changed AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON customer
+ FOR EACH STATEMENT EXECUTE FUNCTION notify_table_changed();
+CREATE TRIGGER orders_notify_changed AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON orders
+ FOR EACH STATEMENT EXECUTE FUNCTION notify_table_changed();
+CREATE TRIGGER contains_notify_changed AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON contains
+ FOR EACH STATEMENT EXECUTE FUNCTION notify_table_changed();
+CREATE TRIGGER pay_notify_changed AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON pay
+ FOR EACH STATEMENT EXECUTE FUNCTION notify_table_changed();
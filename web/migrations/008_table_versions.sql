@@ -0,0 +1,21 @@
+-- Per-table version numbers for conditional GETs (see versions.py): every
+-- statement writing to a table takes the next value of its sequence and sends
+-- it along with the table_changed notification of migration 007, as
+-- '<table> <version>'. Sequences take no row locks, so concurrent writers do
+-- not queue behind a shared counter, and listeners only learn a version once
+-- the write that took it has committed.
+
+CREATE SEQUENCE IF NOT EXISTS product_version_seq;
+CREATE SEQUENCE IF NOT EXISTS supplier_version_seq;
+CREATE SEQUENCE IF NOT EXISTS delivery_version_seq;
+CREATE SEQUENCE IF NOT EXISTS customer_version_seq;
+CREATE SEQUENCE IF NOT EXISTS orders_version_seq;
+CREATE SEQUENCE IF NOT EXISTS contains_version_seq;
+CREATE SEQUENCE IF NOT EXISTS pay_version_seq;
+
+CREATE OR REPLACE FUNCTION notify_table_changed() RETURNS TRIGGER AS $$
+BEGIN
+  PERFORM pg_notify('table_changed', TG_TABLE_NAME || ' ' || nextval(TG_TABLE_NAME || '_version_seq'));
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,20 @@
+-- Take the version of a table once per transaction rather than once per
+-- statement (see 008). With a version of its own, every statement sent a
+-- distinct table_changed payload, which Postgres no longer folds into one, so
+-- a batch of executemany() inserts notified every worker thousands of times.
+-- The version taken first is kept in a transaction-local setting, so all the
+-- statements of a transaction send the same payload, delivered once on commit.
+
+CREATE OR REPLACE FUNCTION notify_table_changed() RETURNS TRIGGER AS $$
+DECLARE
+  table_version TEXT := current_setting('table_version.' || TG_TABLE_NAME, true);
+BEGIN
+  -- unset in this session, or reset to empty by the end of a transaction
+  IF table_version IS NULL OR table_version = '' THEN
+    table_version := nextval(TG_TABLE_NAME || '_version_seq')::text;
+    PERFORM set_config('table_version.' || TG_TABLE_NAME, table_version, true);
+  END IF;
+  PERFORM pg_notify('table_changed', TG_TABLE_NAME || ' ' || table_version);
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
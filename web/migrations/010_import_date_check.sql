@@ -0,0 +1,12 @@
+-- Whether a text is a date that exists, for the CSV importer (see importer.py),
+-- which checks staged text before casting it: a pattern alone lets through
+-- 2023-02-30, whose ::date cast would fail the whole import.
+
+CREATE OR REPLACE FUNCTION is_valid_date(value TEXT) RETURNS BOOLEAN AS $$
+BEGIN
+  PERFORM value::date;
+  RETURN true;
+EXCEPTION WHEN invalid_datetime_format OR datetime_field_overflow THEN
+  RETURN false;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
@@ -0,0 +1,88 @@
+"""The LISTEN connection of each worker process, shared by every channel.
+
+invalidation.py (table_changed) and events.py (order_events) register a
+Handler for their channel with on(), when the app is loaded. start() then
+runs, once per process, a Listener thread that LISTENs on every registered
+channel over a single connection outside the pool: whatever it listens to, a
+worker holds one database connection besides its pool.
+
+psycopg 3.1 keeps the connection locked while it waits for notifications, so
+no channel can be added to it meanwhile; a handler registered once the
+listener runs is only listened to after it reconnects.
+"""
+import logging
+import threading
+import time
+
+import psycopg
+
+from perprocess import PerProcessThread
+
+# seconds between reconnection attempts
+RECONNECT_DELAY = 5
+
+log = logging.getLogger(__name__)
+
+
+class Handler:
+    """Receives the notifications of a channel, on the listener thread."""
+
+    def connected(self, conn):
+        """Listening again, on ``conn``; notifications sent meanwhile were lost."""
+
+    def notify(self, payload):
+        """A notification on the channel, in commit order."""
+
+    def disconnected(self):
+        """No longer listening, until the next connected()."""
+
+
+# channel -> its Handlers
+handlers = {}
+
+
+def on(channel, handler):
+    """Hand the notifications on ``channel`` to ``handler`` too."""
+    handlers.setdefault(channel, []).append(handler)
+
+
+class Listener(threading.Thread):
+    """Dispatches the notifications on every channel of ``handlers``."""
+
+    def __init__(self, conninfo):
+        super().__init__(name="notifications", daemon=True)
+        self.conninfo = conninfo
+
+    def run(self):
+        while True:
+            listening = {channel: list(channel_handlers) for channel, channel_handlers in handlers.items()}
+            every = [handler for channel_handlers in listening.values() for handler in channel_handlers]
+            try:
+                with psycopg.connect(self.conninfo, autocommit=True) as conn:
+                    for channel in listening:
+                        conn.execute(f"LISTEN {channel};")
+                    for handler in every:
+                        handler.connected(conn)
+                    for notify in conn.notifies():
+                        for handler in listening[notify.channel]:
+                            self.dispatch(handler, notify)
+            except psycopg.Error as e:
+                log.warning(f"Notification listener disconnected: {e}")
+            for handler in every:
+                handler.disconnected()
+            time.sleep(RECONNECT_DELAY)
+
+    def dispatch(self, handler, notify):
+        # a handler failing on one notification must not stop the others
+        try:
+            handler.notify(notify.payload)
+        except Exception:
+            log.exception(f"Could not handle {notify.payload!r} on {notify.channel}.")
+
+
+listener = PerProcessThread(Listener)
+
+
+def start(conninfo):
+    """Start the listener of this process, unless it is already running."""
+    listener.start(conninfo)
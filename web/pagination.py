@@ -0,0 +1,75 @@
+"""Keyset pagination for the list endpoints.
+
+A page is requested with ``?after=<token>&limit=<n>``. The token is an opaque
+encoding of the sort key of the last row of the previous page, so every page
+is an index range scan that starts where the previous one stopped, however
+deep into the table it is.
+"""
+import base64
+import binascii
+import datetime
+import json
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def page_size(args):
+    """Return the page size requested in ``args``, within [1, MAX_PAGE_SIZE]."""
+    try:
+        size = int(args.get("limit", PAGE_SIZE))
+    except ValueError:
+        size = PAGE_SIZE
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode()
+
+
+def date_key(value):
+    """Check a date sort key: an ISO date, or "infinity" before the first row."""
+    if value != "infinity":
+        datetime.date.fromisoformat(value)
+    return value
+
+
+def decode_cursor(token, first, kinds=None):
+    """Return the key values encoded in ``token``, or ``first`` if there is none.
+
+    ``first`` is the key that sorts before every row, used for the first page.
+    ``kinds`` gives, for every value, either its exact type or a function that
+    raises ValueError or TypeError on a bad one; it defaults to the types of
+    ``first``. A malformed token, or one with a value of the wrong kind, also
+    yields the first page.
+    """
+    if not token:
+        return tuple(first)
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except (ValueError, binascii.Error):
+        return tuple(first)
+    if not isinstance(values, list) or len(values) != len(first):
+        return tuple(first)
+    for value, kind in zip(values, kinds or [type(value) for value in first]):
+        if isinstance(kind, type):
+            # exact, so that neither a list passes for a str nor a bool for an int
+            if type(value) is not kind:
+                return tuple(first)
+        else:
+            try:
+                kind(value)
+            except (ValueError, TypeError):
+                return tuple(first)
+    return tuple(values)
+
+
+def split_page(rows, size, key):
+    """Split a query result fetched with LIMIT size + 1 into (page, next token).
+
+    The next token is None on the last page.
+    """
+    if len(rows) <= size:
+        return rows, None
+    rows = rows[:size]
+    return rows, encode_cursor(key(rows[-1]))
@@ -0,0 +1,41 @@
+"""Background threads started at most once in every process.
+
+Threads do not survive a fork, and a server that loads the app before forking
+(gunicorn --preload, see pools.py) runs it in processes other than the one
+that imported it. So the background threads of the app are started lazily,
+on first use in each process, through a PerProcessThread.
+"""
+import os
+import threading
+
+
+class PerProcessThread:
+    """Starts one ``thread_class(*args)`` in every process, on the first
+    start() there."""
+
+    def __init__(self, thread_class):
+        self.thread_class = thread_class
+        self.lock = threading.Lock()
+        self.thread = None
+        # the process that started self.thread
+        self.pid = None
+        os.register_at_fork(after_in_child=self.after_fork)
+
+    def after_fork(self):
+        # the lock may have been held by another thread of the parent
+        self.lock = threading.Lock()
+
+    def start(self, *args):
+        """The thread of this process, started first unless it already is."""
+        if self.pid == os.getpid():
+            return self.thread
+        with self.lock:
+            if self.pid != os.getpid():
+                self.thread = self.thread_class(*args)
+                self.thread.start()
+                self.pid = os.getpid()
+            return self.thread
+
+    def started(self):
+        """Whether this process has started its thread."""
+        return self.pid == os.getpid()
@@ -0,0 +1,99 @@
+"""Checks that the hot queries are planned on the indexes meant for them
+(migrations/004_access_path_indexes.sql and 005_search_indexes.sql).
+
+Every check EXPLAINs a statement, without running it, and looks for the
+expected index anywhere in the plan. On a small database the planner rightly
+prefers sequential scans, so ``force_index`` disables them to check that the
+index is at least usable; run without it against a realistically sized
+database (see generate.py) to check it is actually chosen.
+"""
+import cascade
+import search
+import statements
+
+# (name, statement, sample parameters, expected index)
+CHECKS = (
+    (
+        "c_order_index",
+        statements.STATEMENTS["customer_orders"],
+        {"cust_no": 1, "date": "infinity", "order_no": 2147483647, "limit": 51},
+        "orders_cust_no_date_idx",
+    ),
+    (
+        "order_index",
+        statements.STATEMENTS["order_page"],
+        {"date": "infinity", "order_no": 2147483647, "limit": 51},
+        "orders_date_idx",
+    ),
+    (
+        "product_index",
+        statements.STATEMENTS["product_page"],
+        {"name": "", "SKU": "", "limit": 51},
+        "product_name_idx",
+    ),
+    (
+        "product_delete (orders)",
+        cascade.DELETE_PRODUCT_ORDERS,
+        {"skus": ["SKU"]},
+        "contains_sku_idx",
+    ),
+    (
+        "product_delete (catalog)",
+        cascade.DELETE_PRODUCT_CATALOG,
+        {"skus": ["SKU"]},
+        "supplier_sku_idx",
+    ),
+    (
+        "order_delete",
+        cascade.DELETE_ORDER,
+        {"order_no": 1},
+        "process_order_no_idx",
+    ),
+    (
+        "customer_delete",
+        cascade.DELETE_CUSTOMERS,
+        {"cust_nos": [1]},
+        "orders_cust_no_date_idx",
+    ),
+    (
+        "supplier_delete",
+        cascade.DELETE_SUPPLIER,
+        {"TIN": "TIN"},
+        "delivery_tin_idx",
+    ),
+    (
+        "search_customers",
+        search.SEARCH_CUSTOMERS,
+        search.search_params("ana", search.SEARCH_LIMIT),
+        "customer_name_prefix_idx",
+    ),
+    (
+        "search_products",
+        search.SEARCH_PRODUCTS,
+        search.search_params("lamp", search.SEARCH_LIMIT),
+        "product_name_trgm_idx",
+    ),
+)
+
+
+def indexes_used(plan):
+    """Names of every index scanned anywhere in a JSON plan node."""
+    names = {plan["Index Name"]} if "Index Name" in plan else set()
+    for child in plan.get("Plans", ()):
+        names |= indexes_used(child)
+    return names
+
+
+def check(conn, force_index=False):
+    """Return (name, expected index, indexes used, ok) for every check."""
+    results = []
+    with conn.cursor() as cur:
+        # rolled back, so nothing (not even the settings) outlives the checks
+        with conn.transaction(force_rollback=True):
+            if force_index:
+                cur.execute("SET LOCAL enable_seqscan = off;")
+            for name, query, params, index in CHECKS:
+                (plan,) = cur.execute(f"EXPLAIN (FORMAT JSON) {query}", params).fetchone()
+                used = indexes_used(plan[0]["Plan"])
+                results.append((name, index, sorted(used), index in used))
+    return results
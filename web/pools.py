@@ -0,0 +1,71 @@
+"""A connection pool that can be created before a pre-fork server forks.
+
+A psycopg ConnectionPool connects, and starts its worker threads, as soon as
+it is opened. Opened at import, as app.py used to, a server that loads the
+app before forking (gunicorn --preload) would hand every worker a copy of the
+parent's sockets, shared by all of them, and a pool whose threads did not
+survive the fork. ForkSafePool instead opens a pool of its own in every
+process, on its first use there, and closes it when that process exits.
+
+A pool inherited from the parent is left alone rather than closed: closing
+it would end the parent's sessions, whose sockets the child shares.
+"""
+import atexit
+import logging
+import os
+import threading
+
+from psycopg_pool import ConnectionPool
+
+log = logging.getLogger(__name__)
+
+
+class ForkSafePool:
+    """Opens a ConnectionPool(conninfo, **kwargs) lazily in every process."""
+
+    def __init__(self, conninfo, **kwargs):
+        self.conninfo = conninfo
+        self.kwargs = kwargs
+        self.lock = threading.Lock()
+        self.pool = None
+        self.pid = None
+        # pools inherited across a fork, kept so they are never closed
+        self.inherited = []
+        os.register_at_fork(after_in_child=self.after_fork)
+        atexit.register(self.close)
+
+    def after_fork(self):
+        # the lock may have been held by another thread of the parent
+        self.lock = threading.Lock()
+        if self.pool is not None:
+            self.inherited.append(self.pool)
+        self.pool = None
+        self.pid = None
+
+    def get(self):
+        """The pool of this process, opened on first use."""
+        with self.lock:
+            if self.pid != os.getpid():
+                self.pool = ConnectionPool(self.conninfo, open=True, **self.kwargs)
+                self.pid = os.getpid()
+                log.debug(f"Opened connection pool in process {self.pid}.")
+            return self.pool
+
+    def connection(self, timeout=None):
+        return self.get().connection(timeout)
+
+    def get_stats(self):
+        """The stats of the pool of this process, empty until it is opened."""
+        with self.lock:
+            if self.pool is None or self.pid != os.getpid():
+                return {}
+            return self.pool.get_stats()
+
+    def close(self, timeout=5.0):
+        """Close the pool of this process, if it has one."""
+        with self.lock:
+            if self.pool is not None and self.pid == os.getpid():
+                self.pool.close(timeout)
+                log.debug(f"Closed connection pool in process {self.pid}.")
+            self.pool = None
+            self.pid = None
@@ -0,0 +1,111 @@
+"""Customer and product search.
+
+A term matches by prefix (case-insensitive) on names, emails, SKUs and EANs,
+by exact customer number or EAN, and fuzzily by trigram similarity on names;
+prefix and exact matches rank first. Every branch is an index scan
+(migrations/005_search_indexes.sql) bounded by the result limit.
+
+Autocomplete over the product catalog does not go to the database at all: a
+PrefixIndex of product names and SKUs is kept in the catalog cache.
+"""
+import bisect
+
+SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
+SEARCH_CUSTOMERS = """
+    SELECT cust_no, name, email, phone, address
+    FROM (
+        (SELECT cust_no, name, email, phone, address, 2.0 AS score
+        FROM customer
+        WHERE cust_no = %(number)s)
+        UNION ALL
+        (SELECT cust_no, name, email, phone, address, 1.0 AS score
+        FROM customer
+        WHERE lower(name) LIKE %(prefix)s OR lower(email) LIKE %(prefix)s
+        LIMIT %(limit)s)
+        UNION ALL
+        (SELECT cust_no, name, email, phone, address, similarity(name, %(term)s) AS score
+        FROM customer
+        WHERE name %% %(term)s
+        ORDER BY score DESC
+        LIMIT %(limit)s)
+    ) matches
+    GROUP BY cust_no, name, email, phone, address
+    ORDER BY max(score) DESC, name ASC
+    LIMIT %(limit)s;
+"""
+
+SEARCH_PRODUCTS = """
+    SELECT SKU, name, price, description, ean
+    FROM (
+        (SELECT SKU, name, price, description, ean, 2.0 AS score
+        FROM product
+        WHERE ean = %(number)s)
+        UNION ALL
+        (SELECT SKU, name, price, description, ean, 1.0 AS score
+        FROM product
+        WHERE lower(name) LIKE %(prefix)s OR lower(SKU) LIKE %(prefix)s OR ean::text LIKE %(prefix)s
+        LIMIT %(limit)s)
+        UNION ALL
+        (SELECT SKU, name, price, description, ean, similarity(name, %(term)s) AS score
+        FROM product
+        WHERE name %% %(term)s
+        ORDER BY score DESC
+        LIMIT %(limit)s)
+    ) matches
+    GROUP BY SKU, name, price, description, ean
+    ORDER BY max(score) DESC, name ASC
+    LIMIT %(limit)s;
+"""
+
+
+def result_limit(args):
+    """Return the number of results requested in ``args``, within [1, MAX_SEARCH_LIMIT]."""
+    try:
+        limit = int(args.get("limit", SEARCH_LIMIT))
+    except ValueError:
+        limit = SEARCH_LIMIT
+    return max(1, min(limit, MAX_SEARCH_LIMIT))
+
+
+def search_params(term, limit):
+    """Parameters of SEARCH_CUSTOMERS and SEARCH_PRODUCTS for ``term``."""
+    escaped = term.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return {
+        "term": term,
+        "prefix": escaped + "%",
+        # customer numbers are integers, EANs 13 digits; isdigit() alone also
+        # accepts digits such as "²", which int() rejects
+        "number": int(term) if term.isascii() and term.isdigit() and len(term) <= 13 else None,
+        "limit": limit,
+    }
+
+
+class PrefixIndex:
+    """Rows under lowercase keys, sorted, so that all the keys starting with a
+    prefix are found by binary search."""
+
+    def __init__(self, entries):
+        entries = sorted(entries, key=lambda entry: entry[0])
+        self.keys = [key for key, _ in entries]
+        self.rows = [row for _, row in entries]
+
+    @classmethod
+    def for_products(cls, products):
+        """Index the catalog rows by name and by SKU."""
+        return cls(
+            [(product.name.lower(), product) for product in products]
+            + [(product.sku.lower(), product) for product in products]
+        )
+
+    def complete(self, prefix, limit):
+        """The first ``limit`` distinct rows with a key starting with ``prefix``."""
+        prefix = prefix.lower()
+        matches = []
+        for i in range(bisect.bisect_left(self.keys, prefix), len(self.keys)):
+            if len(matches) == limit or not self.keys[i].startswith(prefix):
+                break
+            if self.rows[i] not in matches:
+                matches.append(self.rows[i])
+        return matches
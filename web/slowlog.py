@@ -0,0 +1,107 @@
+"""Slow-query log with EXPLAIN capture.
+
+Statements slower than SLOW_QUERY_MS are logged to the "slow_queries" logger
+(a rotating file, see app.py) with the shape of their parameters. At most
+SLOW_QUERY_EXPLAINS_PER_MINUTE of them also get their plan captured, so a
+burst of slow queries cannot turn into a burst of EXPLAINs:
+
+- the statement is run once more under EXPLAIN ANALYZE, BUFFERS, in a read
+  only savepoint that is always rolled back: writes fail there, and so do
+  functions such as nextval(), while the notifications of pg_notify() are
+  never sent;
+- a statement that cannot run read only (any write) is only planned.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+import psycopg
+
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 500))
+SLOW_QUERY_EXPLAINS_PER_MINUTE = float(os.environ.get("SLOW_QUERY_EXPLAINS_PER_MINUTE", 6))
+
+log = logging.getLogger("slow_queries")
+
+
+class RateLimiter:
+    """Token bucket allowing ``per_minute`` events, with bursts of up to as many."""
+
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+explain_limiter = RateLimiter(SLOW_QUERY_EXPLAINS_PER_MINUTE)
+
+
+def params_shape(params):
+    """Describe the parameters by type (and length for sequences), never by value."""
+
+    def shape(value):
+        if isinstance(value, (list, tuple)):
+            return f"{type(value).__name__}[{len(value)}]"
+        return type(value).__name__
+
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: shape(value) for key, value in params.items()}
+    return [shape(value) for value in params]
+
+
+def run_explain(conn, options, query, params):
+    plan = None
+    # a savepoint, so a failing EXPLAIN leaves the caller's transaction usable;
+    # a plain cursor, so the EXPLAIN itself is not timed and logged
+    with conn.transaction():
+        cur = psycopg.Cursor(conn)
+        cur.execute("SET LOCAL transaction_read_only = on;")
+        (plan,) = cur.execute(f"EXPLAIN ({options}) {query}", params).fetchone()
+        cur.close()
+        # whatever the statement did, even a pg_notify(), is undone
+        raise psycopg.Rollback
+    return plan
+
+
+def explain(conn, query, params):
+    """Return the JSON plan of ``query``, or None if it cannot be explained."""
+    try:
+        return run_explain(conn, "ANALYZE, BUFFERS, FORMAT JSON", query, params)
+    except psycopg.Error as e:
+        log.debug(f"Could not explain statement with ANALYZE: {e}")
+    try:
+        return run_explain(conn, "FORMAT JSON", query, params)
+    except psycopg.Error as e:
+        log.debug(f"Could not explain statement: {e}")
+        return None
+
+
+def check(conn, query, params, elapsed, explainable=True):
+    """Log the statement if it took longer than SLOW_QUERY_MS."""
+    elapsed_ms = elapsed * 1000
+    if elapsed_ms < SLOW_QUERY_MS:
+        return
+
+    entry = {
+        "duration_ms": round(elapsed_ms, 1),
+        "query": " ".join(str(query).split()),
+        "params": params_shape(params),
+    }
+    if explainable and explain_limiter.allow():
+        entry["plan"] = explain(conn, query, params)
+    log.warning(json.dumps(entry, default=str))
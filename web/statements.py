@@ -0,0 +1,157 @@
+"""Registry of the statements run by the pages, shared by app.py and asgi.py.
+
+They are executed by name with prepare=True, so each pooled connection parses
+and plans them once, the first time it runs them, and afterwards only binds
+the parameters. metrics.statement_prepares counts, per statement, the
+executions that found it already prepared on their connection ("hit") and
+those that had to prepare it ("miss").
+"""
+import threading
+import weakref
+
+import metrics
+
+STATEMENTS = {
+    "product_list": """
+        SELECT SKU, name, price, description
+        FROM product
+        ORDER BY name ASC;
+    """,
+    "product_page": """
+        SELECT SKU, name, price, description
+        FROM product
+        WHERE (name, SKU) > (%(name)s, %(SKU)s)
+        ORDER BY name ASC, SKU ASC
+        LIMIT %(limit)s;
+    """,
+    "product_by_sku": """
+        SELECT SKU, name, price, description
+        FROM product
+        WHERE SKU = %(SKU)s;
+    """,
+    "order_page": """
+        SELECT orders.cust_no, orders.order_no, orders.date, customer.name,
+        orders.total_value, orders.item_count
+        FROM orders INNER JOIN customer ON orders.cust_no = customer.cust_no
+        WHERE (orders.date, orders.order_no) < (%(date)s::date, %(order_no)s)
+        ORDER BY orders.date DESC, orders.order_no DESC
+        LIMIT %(limit)s;
+    """,
+    "customer_orders": """
+        SELECT cust_no, order_no, date, name, total_value, item_count
+        FROM orders INNER JOIN customer USING (cust_no)
+        WHERE cust_no = %(cust_no)s
+        AND (date, order_no) < (%(date)s::date, %(order_no)s)
+        ORDER BY date DESC, order_no DESC
+        LIMIT %(limit)s;
+    """,
+    # line items, the order totals (see migrations/006_order_totals.sql) and
+    # the paid flag in one round trip
+    "order_items": """
+        SELECT sku, qty, price, name, cust_no, qty*price as sub_total,
+        orders.total_value, orders.item_count,
+        EXISTS (SELECT 1 FROM pay WHERE pay.order_no = orders.order_no) as paid
+        FROM orders INNER JOIN (contains INNER JOIN product USING (sku)) USING (order_no)
+        WHERE order_no = %(order_no)s
+        ORDER BY sku ASC;
+    """,
+    "pay_order": """
+        INSERT INTO pay (order_no, cust_no)
+        VALUES (%(order_no)s, %(cust_no)s);
+    """,
+    "product_update": """
+        UPDATE product
+        SET price = %(price)s, description = %(description)s
+        WHERE SKU = %(SKU)s;
+    """,
+    "product_create": """
+        INSERT INTO product (sku, name, description, price, ean)
+        VALUES (%(sku)s, %(name)s, %(description)s, %(price)s, %(ean)s);
+    """,
+    "supplier_page": """
+        SELECT supplier.TIN, supplier.name as sn, supplier.SKU, product.name as pn
+        FROM supplier
+        INNER JOIN product ON supplier.SKU = product.SKU
+        WHERE supplier.TIN > %(after)s
+        ORDER BY supplier.TIN ASC
+        LIMIT %(limit)s;
+    """,
+    "supplier_create": """
+        INSERT INTO supplier (tin, name, address, sku, date)
+        VALUES (%(tin)s, %(name)s, %(address)s, %(sku)s, %(date)s);
+    """,
+    "customer_page": """
+        SELECT name, cust_no, phone, address
+        FROM customer
+        WHERE cust_no > %(after)s
+        ORDER BY cust_no ASC
+        LIMIT %(limit)s;
+    """,
+    "customer_create": """
+        INSERT INTO customer (cust_no, name, email, phone, address)
+        VALUES (%(cust_no)s, %(name)s, %(email)s, %(phone)s, %(address)s);
+    """,
+    # quantity and value per product, globally and by city, month, day of
+    # month and day of week (see migrations/003_sales_cube.sql)
+    "sales_totals": """
+        SELECT sku, city, month, day_of_month, day_of_week,
+        SUM(qty) as total_quantity, SUM(total_price) as total_price
+        FROM sales_cube
+        WHERE year = %(year)s
+        GROUP BY GROUPING SETS((),(sku),(sku,city),(sku,month),(sku,day_of_month),(sku,day_of_week))
+        ORDER BY sku, city, month, day_of_month, day_of_week;
+    """,
+    # days without sales count as zero, so divide by the days in date_dim
+    "sales_daily_average": """
+        WITH days AS (
+            SELECT month, day_of_week, COUNT(*) as n
+            FROM date_dim
+            WHERE year = %(year)s
+            GROUP BY GROUPING SETS((),(month),(day_of_week))
+        ),
+        sales AS (
+            SELECT month, day_of_week, SUM(total_price) as total_price
+            FROM sales_cube
+            WHERE year = %(year)s
+            GROUP BY GROUPING SETS((),(month),(day_of_week))
+        )
+        SELECT days.month, days.day_of_week,
+        ROUND(COALESCE(sales.total_price, 0) / days.n, 2) as average_price
+        FROM days LEFT JOIN sales
+        ON days.month IS NOT DISTINCT FROM sales.month
+        AND days.day_of_week IS NOT DISTINCT FROM sales.day_of_week
+        ORDER BY days.month, days.day_of_week;
+    """,
+}
+
+lock = threading.Lock()
+# connection -> names of the statements it has prepared; dropped with the connection
+prepared = weakref.WeakKeyDictionary()
+
+
+def is_prepared(conn, name):
+    with lock:
+        return name in prepared.get(conn, ())
+
+
+def record(conn, name, hit):
+    """Count the execution, once it succeeded and so left the statement prepared."""
+    with lock:
+        prepared.setdefault(conn, set()).add(name)
+    metrics.statement_prepares.inc((name, "hit" if hit else "miss"))
+
+
+def execute(cur, name, params):
+    """Execute the registered statement ``name`` on ``cur``."""
+    hit = is_prepared(cur.connection, name)
+    cur.execute(STATEMENTS[name], params, prepare=True)
+    record(cur.connection, name, hit)
+    return cur
+
+
+async def execute_async(cur, name, params):
+    """execute() for an async cursor."""
+    hit = is_prepared(cur.connection, name)
+    await cur.execute(STATEMENTS[name], params, prepare=True)
+    record(cur.connection, name, hit)
+    return cur
@@ -0,0 +1,56 @@
+"""Streaming JSON responses for the list APIs.
+
+Rows are read from a named (server-side) cursor in chunks and written to the
+client as they arrive, so a full export never has to fit in worker memory.
+"""
+from flask import current_app
+from flask import Response
+from flask import stream_with_context
+from psycopg.rows import namedtuple_row
+
+CHUNK_SIZE = 1000
+
+
+def requested_format(request):
+    """Return "ndjson" or "json" if the client asked for a stream, else None.
+
+    NDJSON is chosen with ``Accept: application/x-ndjson`` or ``?stream=ndjson``,
+    a single JSON array with ``?stream=1``.
+    """
+    stream = request.args.get("stream")
+    if stream == "ndjson" or (
+        request.accept_mimetypes["application/x-ndjson"]
+        and not request.accept_mimetypes["text/html"]
+    ):
+        return "ndjson"
+    if stream in ("1", "json"):
+        return "json"
+    return None
+
+
+def stream_query(pool, name, query, params, fmt):
+    """Respond with every row of ``query``, encoded like ``jsonify`` does."""
+    dumps = current_app.json.dumps
+
+    def generate():
+        with pool.connection() as conn:
+            with conn.cursor(name=name, row_factory=namedtuple_row) as cur:
+                cur.execute(query, params)
+                first = True
+                if fmt == "json":
+                    yield "["
+                while True:
+                    rows = cur.fetchmany(CHUNK_SIZE)
+                    if not rows:
+                        break
+                    if fmt == "ndjson":
+                        yield "".join(dumps(row) + "\n" for row in rows)
+                    else:
+                        chunk = ",".join(dumps(row) for row in rows)
+                        yield chunk if first else "," + chunk
+                    first = False
+                if fmt == "json":
+                    yield "]"
+
+    mimetype = "application/x-ndjson" if fmt == "ndjson" else "application/json"
+    return Response(stream_with_context(generate()), mimetype=mimetype)
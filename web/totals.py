@@ -0,0 +1,36 @@
+"""Backfill of orders.total_value and orders.item_count
+(migrations/006_order_totals.sql).
+
+The triggers keep the totals of new and changed orders right; orders that
+existed before the migration are filled in here, BATCH_SIZE orders per
+transaction so that a large table is never locked all at once. Safe to run
+again: orders whose totals are already right are not rewritten.
+"""
+
+BATCH_SIZE = 10_000
+
+
+def backfill(conn, log):
+    """Recompute the totals of every order; return the number of orders seen."""
+    conn.commit()
+    last, seen = 0, 0
+    while True:
+        with conn.transaction():
+            order_nos = [
+                order_no
+                for (order_no,) in conn.execute(
+                    """
+                    SELECT order_no FROM orders
+                    WHERE order_no > %(last)s
+                    ORDER BY order_no ASC
+                    LIMIT %(limit)s;
+                    """,
+                    {"last": last, "limit": BATCH_SIZE},
+                )
+            ]
+            if not order_nos:
+                return seen
+            conn.execute("SELECT refresh_order_totals(%(order_nos)s::integer[]);", {"order_nos": order_nos})
+        last = order_nos[-1]
+        seen += len(order_nos)
+        log.info(f"Backfilled totals up to order {last}.")
@@ -0,0 +1,143 @@
+"""Conditional GETs (ETag / Last-Modified) from per-table version numbers.
+
+Every transaction writing to a table announces a new version of it over
+table_changed (migrations 008 and 009), which the invalidation listener of
+each worker records in a TableVersions. A view decorated with
+@conditional(versions, tables...) tags its response with the versions of the
+tables it reads, and answers a request already holding that tag with
+304 Not Modified before the view, and so its queries, run at all.
+
+Versions are taken when a statement runs but announced when it commits, so
+they do not arrive in increasing order. What every worker does see is the
+same announcements in the same (commit) order, so the current version of a
+table is the last one announced: it changes with every committed write, and
+it is only known once that write is visible to the queries of the view.
+While the listener is disconnected versions are unknown and responses go
+untagged.
+
+A write route also touch()es the tables it wrote as soon as it commits, so
+its own redirect never matches a tag from before the write, even when it
+reaches the same worker ahead of the notification. Tagged responses carry
+Cache-Control: no-cache, so browsers always revalidate them instead of
+guessing how long they stay fresh.
+
+Only app.py serves conditional GETs; asgi.py does not track versions.
+"""
+import datetime
+import functools
+import hashlib
+import threading
+import time
+
+from flask import make_response
+from flask import request
+
+LOAD = """
+    SELECT substring(sequencename FROM '^(.*)_version_seq$'), COALESCE(last_value, 0)
+    FROM pg_sequences
+    WHERE schemaname = current_schema() AND sequencename LIKE '%\\_version\\_seq';
+"""
+
+
+class TableVersions:
+    """The last announced version of every table, and when it was announced."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.versions = None
+        self.modified = {}
+        # suffix of the versions touched locally, see touch()
+        self.touches = 0
+
+    def load(self, conn):
+        """Start from the current versions; called once listening."""
+        rows = conn.execute(LOAD).fetchall()
+        now = time.time()
+        with self.lock:
+            # the sequences may already hold versions of uncommitted writes,
+            # so these are marked apart from any version announced later
+            self.versions = {table: f"{version}~" for table, version in rows}
+            self.modified = {table: now for table in self.versions}
+
+    def update(self, table, version):
+        with self.lock:
+            if self.versions is not None:
+                self.versions[table] = version
+                self.modified[table] = time.time()
+
+    def touch(self, *tables):
+        """Give ``tables`` a new version, local to this worker, until the
+        notification of the write that changed them arrives."""
+        now = time.time()
+        with self.lock:
+            if self.versions is not None:
+                for table in tables:
+                    self.touches += 1
+                    version = self.versions.get(table, "0").split("+")[0]
+                    self.versions[table] = f"{version}+{self.touches}"
+                    self.modified[table] = now
+
+    def clear(self):
+        """Forget every version, until the next load()."""
+        with self.lock:
+            self.versions = None
+
+    def get(self, tables):
+        """Return the versions of ``tables`` and their last modification time,
+        or None if they are unknown."""
+        with self.lock:
+            if self.versions is None:
+                return None
+            return (
+                [self.versions.get(table, "0") for table in tables],
+                max(self.modified.get(table, 0) for table in tables),
+            )
+
+
+def etag(versions):
+    """A tag for this URL and representation at the given table versions."""
+    kind = request.accept_mimetypes.best_match(["text/html", "application/json"])
+    key = f"{request.full_path} {kind} {' '.join(versions)}"
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def conditional(table_versions, *tables):
+    """Serve the view with ETag and Last-Modified, and 304 when unchanged."""
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            current = table_versions.get(tables)
+            if current is None or request.method not in ("GET", "HEAD"):
+                return view(*args, **kwargs)
+            versions, modified = current
+            tag = etag(versions)
+            # Last-Modified has a resolution of one second, so it is only given
+            # once that second is over: a client holding it then cannot have
+            # missed a later write within the same second
+            last_modified = None
+            if int(modified) < int(time.time()):
+                last_modified = datetime.datetime.fromtimestamp(int(modified), datetime.timezone.utc)
+
+            # If-None-Match takes precedence over If-Modified-Since
+            if request.if_none_match:
+                unchanged = request.if_none_match.contains(tag)
+            else:
+                unchanged = (
+                    last_modified is not None
+                    and request.if_modified_since is not None
+                    and last_modified <= request.if_modified_since
+                )
+            response = make_response("", 304) if unchanged else make_response(view(*args, **kwargs))
+            if response.status_code in (200, 304):
+                response.set_etag(tag)
+                if last_modified is not None:
+                    response.last_modified = last_modified
+                response.vary.add("Accept")
+                # may be stored, but must be revalidated before every use
+                response.cache_control.no_cache = True
+            return response
+
+        return wrapper
+
+    return decorator